@@ -0,0 +1,134 @@
+"""Checks the compact mode of the prepared data (see storing.write_cube) on
+synthetic feeds (see synthetic.py): Prepares the data in full precision and
+in compact mode and checks for every category and variant that
+- the NaNs (missing data, heads of the diffs and moving averages) are the
+  same
+- the compact values are within the relative tolerance of the full ones
+Reports the sizes of the cube files and of the loaded data (kept by the
+data stores), and the peak memory of the preparations. The same checks
+run on small feeds in the tests (tests/test_storing.py).
+Usage: python benchmarks/compact_tolerance.py [--countries N] [--days N]
+[--us-counties N] [--rtol X]
+The exit status is 1 if any of the checks fails.
+"""
+from argparse import ArgumentParser
+from dataclasses import replace
+from pathlib import Path
+import sys
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+# The project isn't installed: It is imported from the repository root
+root = Path(__file__).resolve().parent.parent
+if str(root) not in sys.path:
+    sys.path.insert(0, str(root))
+
+from benchmarks.synthetic import write_feeds
+from utils.basics import *
+from utils.prepping import prepare_data
+from utils.storing import DataStore, get_cube_file_paths
+
+
+# Processing date of the check
+date = "23-03-10"
+
+
+def prepare(workspace, feeds_path, compact):
+    """Prepares the feeds in feeds_path in the output directory workspace:
+    Returns the data store, the size of the cube file, and the peak memory
+    of the preparation
+    """
+    settings = load_settings(root)
+    use_settings(
+        replace(settings, paths=Paths(settings.paths.settings_dir, workspace))
+    )
+    for file_path in feeds_path.glob("*.csv"):
+        link_file(file_path, get_feed_file_path(date, file_path.stem))
+
+    tracemalloc.start()
+    prepare_data(date, force=True, compact=compact)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    size = sum(path.stat().st_size for path in get_cube_file_paths(date))
+    return DataStore(date, cache_size=1000), size, peak
+
+
+def check(full, compact, rtol):
+    """Compares all variants of the data stores full and compact: Returns
+    the number of failed variants and the bytes of the loaded data (full,
+    compact) in the memo caches of the stores
+    """
+    failures = 0
+    for category in get_categories():
+        for variant in get_variants(category):
+            values = full.get_values(category, variant)
+            compact_values = compact.get_values(category, variant)
+
+            nans = np.isnan(values)
+            ok = np.array_equal(nans, np.isnan(compact_values))
+            ok = ok and np.allclose(
+                compact_values[~nans], values[~nans], rtol=rtol, atol=0
+            )
+            if not ok:
+                failures += 1
+                print(f"FAILED: {category} {variant}")
+    loaded = [
+        sum(values.nbytes for values in store.cache.values())
+        for store in (full, compact)
+    ]
+    return failures, loaded
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Check the compact data types")
+    parser.add_argument(
+        "--countries", help="number of countries", type=int, default=190
+    )
+    parser.add_argument(
+        "--days", help="number of days", type=int, default=1100
+    )
+    parser.add_argument(
+        "--us-counties",
+        help="number of counties per US state (default is 0)",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--rtol",
+        help="relative tolerance (default is 1e-6)",
+        type=float,
+        default=1e-6,
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = Path(tmp_dir)
+        feeds_path = tmp_path / "feeds"
+        write_feeds(
+            feeds_path,
+            countries=args.countries,
+            days=args.days,
+            us_counties=args.us_counties,
+        )
+        full, full_size, full_peak = prepare(
+            tmp_path / "full", feeds_path, False
+        )
+        compact, compact_size, compact_peak = prepare(
+            tmp_path / "compact", feeds_path, True
+        )
+        failures, loaded = check(full, compact, args.rtol)
+
+    for label, full_bytes, compact_bytes in (
+        ("cube files", full_size, compact_size),
+        ("loaded data", *loaded),
+        ("peak memory", full_peak, compact_peak),
+    ):
+        print(
+            f"{label + ':':12} {full_bytes / 2**20:8.1f} MB -> "
+            f"{compact_bytes / 2**20:.1f} MB"
+        )
+    print(f"{failures} variants beyond tolerance {args.rtol}")
+    sys.exit(1 if failures else 0)
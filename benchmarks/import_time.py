@@ -0,0 +1,99 @@
+"""Guards the startup time of the CLI: Runs the light stages of show_data.py
+in fresh interpreters with python -X importtime and checks that
+- none of the heavy dependencies (numpy, pandas, matplotlib) is imported
+- the cumulative import time stays within the budget (in milliseconds)
+Usage: python benchmarks/import_time.py [--budget MS] [--repeat N]
+The exit status is 1 if any of the checks fails.
+"""
+from argparse import ArgumentParser
+from pathlib import Path
+import subprocess
+import sys
+
+
+# Root of the repository (the parent folder of the benchmarks folder)
+root = Path(__file__).resolve().parent.parent
+
+# Heavy dependencies which must not be imported by the light stages
+heavy_modules = ("numpy", "pandas", "matplotlib")
+
+# The light stages: name -> arguments of the interpreter
+stages = {
+    "help": ["show_data.py", "--help"],
+    "facade": ["-c", "import utils; utils.set_date"],
+    "download": ["-c", "import utils; utils.download_data"],
+}
+
+
+def get_import_times(args):
+    """Runs the interpreter with the arguments args and -X importtime in the
+    repository root and returns the imported modules (name -> cumulative
+    import time in microseconds) and the total import time of the top-level
+    imports
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=root,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules, total = {}, 0
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative)
+
+        # Top-level imports aren't indented
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+    return modules, total
+
+
+def check_stage(stage, budget, repeat):
+    """Checks the stage (see stages): Returns True if it doesn't import heavy
+    modules and its best total import time (of repeat runs) is within the
+    budget
+    """
+    times = []
+    for _ in range(repeat):
+        modules, total = get_import_times(stages[stage])
+        times.append(total)
+    heavy = sorted(
+        name for name in modules if name.split(".")[0] in heavy_modules
+    )
+    best = min(times) / 1000
+
+    print(f"{stage:10} {best:8.1f} ms", end="")
+    ok = True
+    if heavy:
+        print(f"  FAILED: imports {', '.join(heavy[:5])}", end="")
+        ok = False
+    if best > budget:
+        print(f"  FAILED: above budget of {budget:.0f} ms", end="")
+        ok = False
+    print()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Check the CLI's import time")
+    parser.add_argument(
+        "--budget",
+        help="maximal import time of a stage in ms (default is 150)",
+        type=float,
+        default=150,
+    )
+    parser.add_argument(
+        "--repeat",
+        help="number of runs per stage, the best is taken (default is 5)",
+        type=int,
+        default=5,
+    )
+    args = parser.parse_args()
+
+    results = [
+        check_stage(stage, args.budget, args.repeat) for stage in stages
+    ]
+    sys.exit(0 if all(results) else 1)
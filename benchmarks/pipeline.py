@@ -0,0 +1,205 @@
+"""Benchmarks (asv) of the stages of the pipeline on synthetic feeds (see
+synthetic.py): Downloading (from a local HTTP server), preparing, loading
+the data of the plots, and rendering, timed (time_*) and with their peak
+memory (peakmem_*). The size of the data is configured with the environment
+variables
+- BENCH_COUNTRIES: Number of countries (default is 190)
+- BENCH_PROVINCES: Number of provinces per country (default is 2)
+- BENCH_US_COUNTIES: Number of counties per US state (default is 0, i.e.
+  no US feeds)
+- BENCH_DAYS: Comma-separated numbers of days, the benchmarks are
+  parameterized over them (default is 365,1100)
+Run in the current environment with: asv run --python=same
+"""
+from dataclasses import replace
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+
+# The project isn't installed: The benchmarks import it from the
+# repository root
+root = Path(__file__).resolve().parent.parent
+if str(root) not in sys.path:
+    sys.path.insert(0, str(root))
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+from benchmarks.synthetic import serve_feeds, write_feeds
+from utils import storing
+from utils.basics import (
+    Paths, get_feed_file_path, link_file, load_settings, use_settings
+)
+from utils.downloading import download_data
+from utils.prepping import prepare_base_data, prepare_data
+from utils.showing import show_countries, show_groups
+
+
+# Processing date of the benchmarks
+date = "23-03-10"
+
+# Size of the synthetic data
+countries = int(os.environ.get("BENCH_COUNTRIES", 190))
+provinces = int(os.environ.get("BENCH_PROVINCES", 2))
+us_counties = int(os.environ.get("BENCH_US_COUNTIES", 0))
+days = [int(n) for n in os.environ.get("BENCH_DAYS", "365,1100").split(",")]
+
+# Categories and variants which are loaded for the plots
+country_plots = {
+    "confirmed": ["cum", "diff", "diff_ma1w"],
+    "deaths": ["cum", "diff", "diff_ma1w"],
+    "active": ["cum", "diff", "diff_ma1w"],
+}
+group_plots = {
+    "confirmed": ["cum_rel_popmio", "diff_rel_popmio_ma1w"],
+    "deaths": ["cum_rel_pop100k", "diff_rel_pop100k_ma1w"],
+    "active": ["cum_rel_popmio", "diff_rel_popmio_ma1w"],
+}
+
+
+def use_workspace(path):
+    """Makes the directory path the output directory of the application"""
+    settings = load_settings(root)
+    use_settings(
+        replace(settings, paths=Paths(settings.paths.settings_dir, Path(path)))
+    )
+
+
+def stage_feeds(workspace, n_days):
+    """Links the synthetic feeds with n_days days from the workspace into
+    the feed directory of the output directory in use
+    """
+    feeds_path = Path(workspace) / str(n_days) / "feeds"
+    for file_path in feeds_path.glob("*.csv"):
+        link_file(file_path, get_feed_file_path(date, file_path.stem))
+
+
+class Pipeline:
+    """Base of the benchmarks: The synthetic feeds, and the data prepared
+    from them, are created once (in asv's cache directory) for every number
+    of days
+    """
+
+    params = [days]
+    param_names = ["days"]
+    number = 1
+    timeout = 600
+
+    def setup_cache(self):
+        workspace = Path("workspace").resolve()
+        for n_days in days:
+            write_feeds(
+                workspace / str(n_days) / "feeds",
+                countries=countries,
+                provinces=provinces,
+                days=n_days,
+                us_counties=us_counties,
+            )
+            use_workspace(workspace / str(n_days) / "output")
+            stage_feeds(workspace, n_days)
+            prepare_data(date, force=True)
+        return str(workspace)
+
+    def setup(self, workspace, n_days):
+        self.tmp_dir = tempfile.mkdtemp()
+        use_workspace(self.tmp_dir)
+
+    def teardown(self, workspace, n_days):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+class Download(Pipeline):
+    """Downloading the feeds from a local HTTP server"""
+
+    def setup(self, workspace, n_days):
+        super().setup(workspace, n_days)
+        self.server, self.urls = serve_feeds(
+            Path(workspace) / str(n_days) / "feeds"
+        )
+
+    def teardown(self, workspace, n_days):
+        self.server.shutdown()
+        self.server.server_close()
+        super().teardown(workspace, n_days)
+
+    def time_download_data(self, workspace, n_days):
+        download_data(date, urls=self.urls)
+
+
+class DownloadNotModified(Download):
+    """Downloading the feeds again: The server reports them as not
+    modified
+    """
+
+    def setup(self, workspace, n_days):
+        super().setup(workspace, n_days)
+        download_data(date, urls=self.urls)
+
+    def time_download_data(self, workspace, n_days):
+        download_data(date, urls=self.urls)
+
+
+class Prepare(Pipeline):
+    """Preparing the downloaded feeds"""
+
+    def setup(self, workspace, n_days):
+        super().setup(workspace, n_days)
+        stage_feeds(workspace, n_days)
+
+    def time_prepare_base_data(self, workspace, n_days):
+        prepare_base_data(date)
+
+    def time_prepare_data(self, workspace, n_days):
+        prepare_data(date, force=True)
+
+    def peakmem_prepare_data(self, workspace, n_days):
+        prepare_data(date, force=True)
+
+
+class Load(Pipeline):
+    """Loading the data of the plots from the prepared data (without the
+    process-wide cache of the data stores)
+    """
+
+    def setup(self, workspace, n_days):
+        use_workspace(Path(workspace) / str(n_days) / "output")
+        storing.stores.clear()
+
+    def teardown(self, workspace, n_days):
+        pass
+
+    def time_load_series_countries(self, workspace, n_days):
+        storing.load_series(date, country_plots, ["Q00", "Q01", "TTL"])
+
+    def time_load_series_groups(self, workspace, n_days):
+        members = [f"Q{i:02d}" for i in range(min(countries, 10))]
+        storing.load_series(date, group_plots, members)
+
+    def peakmem_load_series_countries(self, workspace, n_days):
+        storing.load_series(date, country_plots, ["Q00", "Q01", "TTL"])
+
+
+class Render(Pipeline):
+    """Rendering the plots of a country and of a group (with the default
+    render profile, without the plot cache)
+    """
+
+    def setup(self, workspace, n_days):
+        output = Path(workspace) / str(n_days) / "output"
+        use_workspace(output)
+        shutil.rmtree(output / "plots", ignore_errors=True)
+
+    def teardown(self, workspace, n_days):
+        pass
+
+    def time_show_countries(self, workspace, n_days):
+        show_countries(date, "Q00", length=n_days)
+
+    def time_show_groups(self, workspace, n_days):
+        show_groups(date, {"Q00 vs. Q01": ["Q00", "Q01"]}, length=n_days)
+
+    def peakmem_show_countries(self, workspace, n_days):
+        show_countries(date, "Q00", length=n_days)
@@ -0,0 +1,225 @@
+"""Synthetic feeds with the layout of the JHU files, for the benchmarks:
+- base: UID_ISO_FIPS_LookUp_Table.csv
+- confirmed, deaths, recovered: time_series_covid19_*_global.csv
+- confirmed_us, deaths_us (optional): time_series_covid19_*_US.csv
+Every country has one row without and some rows with province/state, the
+time series are cumulated random numbers. The feeds can be served by a
+local HTTP server (stand-in for the GitHub repository).
+Usage: python benchmarks/synthetic.py DIR [--countries N] [--provinces N]
+[--days N] [--us-counties N] [--seed N]
+"""
+from argparse import ArgumentParser
+import datetime as dt
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import threading
+
+import numpy as np
+
+
+# Root of the repository (the parent folder of the benchmarks folder)
+root = Path(__file__).resolve().parent.parent
+
+# First day of the JHU time series
+first_day = dt.date(2020, 1, 22)
+
+# Columns of the base feed
+base_columns = (
+    "UID,iso2,iso3,code3,FIPS,Admin2,Province_State,Country_Region,Lat,Long_,"
+    "Combined_Key,Population"
+)
+
+
+def get_countries(countries):
+    """Provides the iso3 codes and names of the synthetic countries"""
+    return [(f"Q{i:02d}", f"Country {i}") for i in range(countries)]
+
+
+def get_day_columns(days):
+    """Provides the column names of the days days of the time series"""
+    return ",".join(
+        f"{day.month}/{day.day}/{day.year % 100}"
+        for day in (first_day + dt.timedelta(d) for d in range(days))
+    )
+
+
+def write_feeds(
+    path, countries=190, provinces=2, days=1100, us_counties=0, seed=0
+):
+    """Writes the synthetic feeds base.csv, confirmed.csv, deaths.csv, and
+    recovered.csv for countries countries with provinces provinces each and
+    days days into the directory path. With us_counties > 0 the US feeds
+    confirmed_us.csv and deaths_us.csv are added, with us_counties counties
+    for every US state (see settings file us_states.json). Returns the paths
+    of the files (category -> path).
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    file_paths = {
+        category: path / f"{category}.csv"
+        for category in ("base", "confirmed", "deaths", "recovered")
+    }
+
+    # The lookup table: One row per country (with iso3 code and population)
+    # and one per province
+    rows = [base_columns]
+    uid = 1
+    for iso3, name in get_countries(countries):
+        population = rng.integers(10**5, 10**8)
+        rows.append(
+            f"{uid},{iso3[:2]},{iso3},{uid},,,,{name},1.0,2.0,"
+            f'"{name}",{population}'
+        )
+        for k in range(provinces):
+            uid += 1
+            rows.append(
+                f"{uid},{iso3[:2]},{iso3},{uid},,,Province {k},{name},1.0,"
+                f'2.0,"Province {k}, {name}",{population // 100}'
+            )
+        uid += 1
+
+    # As in the JHU table, not all countries have a population size
+    rows.append(f"{uid},AQ,ATA,10,,,,Antarctica,-71.9,23.3,Antarctica,")
+    if us_counties > 0:
+        rows += write_us_feeds(path, us_counties, days, rng, file_paths)
+    file_paths["base"].write_text("\n".join(rows) + "\n")
+
+    # The time series: Cumulated random numbers, which are smaller for
+    # deaths and recovered cases
+    header = "Province/State,Country/Region,Lat,Long," + get_day_columns(days)
+    for k, category in enumerate(("confirmed", "deaths", "recovered")):
+        shape = countries, provinces + 1, days
+        increments = rng.integers(0, 1000 // (1 + 9 * k), shape)
+        values = np.cumsum(increments, axis=-1)
+        rows = [header]
+        for i, (_, name) in enumerate(get_countries(countries)):
+            for j in range(provinces + 1):
+                province = "" if j == 0 else f"Province {j - 1}"
+                rows.append(
+                    f"{province},{name},1.0,2.0,"
+                    + ",".join(map(str, values[i, j].tolist()))
+                )
+        file_paths[category].write_text("\n".join(rows) + "\n")
+
+    return file_paths
+
+
+def write_us_feeds(path, counties, days, rng, file_paths):
+    """Writes the US feeds confirmed_us.csv and deaths_us.csv with counties
+    counties per state (plus a cruise ship, which doesn't belong to a
+    state) into the directory path, and adds them to file_paths. Returns the
+    rows of the lookup table for the states and the counties.
+    """
+    with (root / "settings" / "us_states.json").open("r") as file:
+        states = list(json.load(file))
+
+    # The lookup rows and the meta columns of the feeds' rows: UID, iso2,
+    # iso3, code3, FIPS, Admin2, Province_State, Country_Region, Lat, Long_,
+    # Combined_Key (and the population sizes)
+    lookup_rows, meta, populations = [], [], []
+    for i, state in enumerate(states):
+        state_population = 0
+        for k in range(counties):
+            uid = 84000000 + 1000 * (i + 1) + k + 1
+            population = int(rng.integers(10**3, 10**6))
+            state_population += population
+            row = (
+                f"{uid},US,USA,840,{uid % 100000},County {k},{state},US,1.0,"
+                f'2.0,"County {k}, {state}, US"'
+            )
+            lookup_rows.append(f"{row},{population}")
+            meta.append(row)
+            populations.append(population)
+        lookup_rows.append(
+            f"{84000000 + i + 1},US,USA,840,{i + 1},,{state},US,1.0,2.0,"
+            f'"{state}, US",{state_population}'
+        )
+    meta.append(
+        '84099999,US,USA,840,99999,,Grand Princess,US,,,"Grand Princess, US"'
+    )
+    populations.append(0)
+
+    header = (
+        "UID,iso2,iso3,code3,FIPS,Admin2,Province_State,Country_Region,Lat,"
+        "Long_,Combined_Key"
+    )
+    for k, category in enumerate(("confirmed_us", "deaths_us")):
+        shape = len(meta), days
+        increments = rng.integers(0, 100 // (1 + 9 * k), shape)
+        values = np.cumsum(increments, axis=-1)
+        if category == "deaths_us":
+            rows = [f"{header},Population,{get_day_columns(days)}"] + [
+                f"{row},{population}," + ",".join(map(str, line.tolist()))
+                for row, population, line in zip(meta, populations, values)
+            ]
+        else:
+            rows = [f"{header},{get_day_columns(days)}"] + [
+                f"{row}," + ",".join(map(str, line.tolist()))
+                for row, line in zip(meta, values)
+            ]
+        file_paths[category] = path / f"{category}.csv"
+        file_paths[category].write_text("\n".join(rows) + "\n")
+
+    return lookup_rows
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """Request handler which doesn't log the requests"""
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_feeds(path):
+    """Serves the files in the directory path via HTTP on a free port of
+    localhost (in a background thread). Returns the server (stop it with
+    shutdown) and the urls of the feeds (category -> url), e.g. for
+    download_data.
+    """
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), partial(QuietHandler, directory=str(path))
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    urls = {
+        file_path.stem: f"http://127.0.0.1:{port}/{file_path.name}"
+        for file_path in sorted(Path(path).glob("*.csv"))
+    }
+    return server, urls
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Write synthetic JHU-shaped feeds")
+    parser.add_argument("path", help="output directory")
+    parser.add_argument(
+        "--countries", help="number of countries", type=int, default=190
+    )
+    parser.add_argument(
+        "--provinces",
+        help="number of provinces per country",
+        type=int,
+        default=2,
+    )
+    parser.add_argument(
+        "--days", help="number of days", type=int, default=1100
+    )
+    parser.add_argument(
+        "--us-counties",
+        help="number of counties per US state (default is 0: no US feeds)",
+        type=int,
+        default=0,
+    )
+    parser.add_argument("--seed", help="random seed", type=int, default=0)
+    args = parser.parse_args()
+
+    write_feeds(
+        args.path,
+        args.countries,
+        args.provinces,
+        args.days,
+        args.us_counties,
+        args.seed,
+    )
@@ -1,6 +1,6 @@
 from argparse import ArgumentParser
 
-from utils import *
+import utils
 
 
 def get_arguments():
@@ -14,9 +14,22 @@ def get_arguments():
         action="store_true",
         default=False,
     )
+    parser.add_argument(
+        "-i", "--incremental",
+        help="prepare only the new (or revised) days of the downloaded data",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "-c", "--compact",
+        help="store and load the prepared data in compact data types",
+        action="store_true",
+        default=False,
+    )
     parser.add_argument(
         "countries",
-        help="specify countries by iso code, e.g. DEU for Germany",
+        help="specify countries by iso code, e.g. DEU for Germany, or region "
+             "aggregates, e.g. europe.west or europe.all",
         nargs="*",
     )
     parser.add_argument(
@@ -24,6 +37,81 @@ def get_arguments():
         help="specify comparison groups, e.g. DEU-FRA for Germany vs. France",
         nargs="*",
     )
+    parser.add_argument(
+        "-b", "--batch",
+        help="run the jobs of a batch file (JSON or YAML, see "
+             "utils/batching.py), e.g. countries, groups, and regions like "
+             "europe/west",
+        metavar="FILE",
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        help="number of worker processes for plotting and backfilling "
+             "(default is 1)",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "-p", "--profile",
+        help="render profile of the plots, e.g. thumbnail, web, print (see "
+             "settings/render_profiles.json, default is default)",
+        default="default",
+    )
+    parser.add_argument(
+        "-t", "--trace",
+        help="write a timing summary and a Chrome-trace file of the run into "
+             "the folder traces",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--backfill",
+        help="prepare the data of all downloaded days (or of the days DATE) "
+             "which haven't been prepared yet, with JOBS worker processes",
+        metavar="DATE",
+        nargs="*",
+    )
+    parser.add_argument(
+        "-o", "--overview",
+        help="plot the overview of all countries (heatmap and small "
+             "multiples) of the confirmed cases and the deaths in VARIANT, "
+             "e.g. diff_rel_pop100k_ma1w (default is diff_ma1w)",
+        metavar="VARIANT",
+        nargs="?",
+        const="diff_ma1w",
+    )
+    parser.add_argument(
+        "-v", "--vintages",
+        help="compare the data of the countries (at least one required) "
+             "with the data prepared on the days DATE, e.g. 21-03-01, to "
+             "show the revisions",
+        metavar="DATE",
+        nargs="+",
+    )
+    parser.add_argument(
+        "-a", "--archive",
+        help="store the data of all but the latest KEEP days in the "
+             "deduplicated snapshot store after the run (default is 1)",
+        metavar="KEEP",
+        type=int,
+        nargs="?",
+        const=1,
+    )
+    parser.add_argument(
+        "-r", "--restore",
+        help="restore the data of archived days, e.g. 21-03-01",
+        metavar="DATE",
+        nargs="+",
+    )
+    parser.add_argument(
+        "-s", "--serve",
+        help="serve the plots on request via HTTP on localhost:PORT after "
+             "the run (default port is 8000)",
+        metavar="PORT",
+        type=int,
+        nargs="?",
+        const=8000,
+    )
     parser.add_argument(
         "-l", "--length",
         help="specify length of time series in days (default is 365 days)",
@@ -39,28 +127,88 @@ if __name__ == "__main__":
     args = get_arguments()
     countries = args.countries
     download = not args.no_download
+    incremental = args.incremental
+    compact = args.compact
     groups = args.groups
     length = args.length
+    jobs = args.jobs
+    profile = args.profile
+
+    # Tracing the stages of the run
+    if args.trace:
+        utils.enable_tracing()
     
     # Setting the date
-    today = set_date()
+    today = utils.set_date()
+
+    # Restoring archived days
+    for date in args.restore or []:
+        utils.restore_data(date)
 
     if download:
         # Downloading data
-        download_data()
+        utils.download_data()
 
         # Preparing data
-        prepare_data(today)
+        utils.prepare_data(
+            today, incremental=incremental, compact=compact
+        )
+
+    # Preparing the data of older days
+    if args.backfill is not None:
+        utils.backfill_data(
+            args.backfill or None, jobs=jobs, compact=compact
+        )
+
+    # Plotting the overview of all countries
+    if args.overview is not None:
+        for category in ("confirmed", "deaths"):
+            utils.show_overview(
+                today,
+                category,
+                args.overview,
+                length=length,
+                profile=profile,
+            )
 
     # show_countries(today, 'TTL', length=length)
     if len(countries) > 0:
-        show_countries(today, *countries, length=length)
+        utils.show_countries(
+            today, *countries, length=length, jobs=jobs, profile=profile
+        )
     
+    # Comparing the data vintages of the countries
+    if args.vintages is not None:
+        utils.show_vintages(
+            today, args.vintages, *countries, length=length, profile=profile
+        )
+
     # Plotting groups of countries
     if groups is not None:
         groups = {
             " vs. ".join(group.split("-")): group.split("-")
             for group in groups
         }
-        show_groups(today, groups, length=length)
- 
+        utils.show_groups(
+            today, groups, length=length, jobs=jobs, profile=profile
+        )
+
+    # Running the jobs of a batch file as one plan
+    if args.batch is not None:
+        utils.run_batch(
+            today, args.batch, length=length, jobs=jobs, profile=profile
+        )
+
+    # Removing the figures of the plot cache no plot refers to anymore
+    utils.prune_plot_cache()
+
+    # Archiving the data of the older days
+    if args.archive is not None:
+        utils.archive_data(keep=args.archive)
+
+    # Serving the plots on request (until interrupted)
+    if args.serve is not None:
+        utils.serve(args.serve, length=length, profile=profile)
+
+    # Writing the trace files
+    utils.save_trace(today)
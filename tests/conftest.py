@@ -0,0 +1,55 @@
+"""Fixtures of the tests: A workspace (output directory) with synthetic
+feeds (see benchmarks/synthetic.py) for the days of the tests
+"""
+from dataclasses import replace
+from pathlib import Path
+import sys
+
+import pytest
+
+# The project isn't installed: It is imported from the repository root
+root = Path(__file__).resolve().parent.parent
+if str(root) not in sys.path:
+    sys.path.insert(0, str(root))
+
+from benchmarks.synthetic import write_feeds
+from utils import basics, prepping, storing
+
+
+# Days of the tests
+date = "23-03-10"
+prev_date = "23-03-09"
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    """Makes the temporary directory the output directory of the settings
+    (the settings files are the ones of the repository), with the process-
+    wide caches cleared. Returns the path of the directory.
+    """
+    settings = basics.current_settings
+    loaded = basics.load_settings(root)
+    paths = basics.Paths(loaded.paths.settings_dir, tmp_path)
+    basics.use_settings(replace(loaded, paths=paths))
+    prepping.base_data.clear()
+    storing.stores.clear()
+    yield tmp_path
+    prepping.base_data.clear()
+    storing.stores.clear()
+    basics.use_settings(settings)
+
+
+def add_feeds(tmp_path, date, **kwargs):
+    """Writes synthetic feeds (see synthetic.write_feeds, small by default)
+    and places them into the feed directory of day date. Returns the paths
+    of the feed files (category -> path).
+    """
+    kwargs = {"countries": 5, "provinces": 2, "days": 60, **kwargs}
+    feeds_path = tmp_path / "feeds" / date
+    file_paths = write_feeds(feeds_path, **kwargs)
+    for category, file_path in file_paths.items():
+        basics.link_file(file_path, basics.get_feed_file_path(date, category))
+    return {
+        category: basics.get_feed_file_path(date, category)
+        for category in file_paths
+    }
@@ -0,0 +1,138 @@
+import csv
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+
+from tests.conftest import add_feeds, date, prev_date
+from utils.basics import (
+    get_feed_file_path,
+    get_settings,
+    get_us_states,
+    use_settings,
+)
+from utils.prepping import (
+    get_base_data,
+    get_first_changed_day,
+    prepare_base_data,
+    prepare_data,
+    read_feeds,
+)
+from utils.storing import DataStore, open_cube, to_floats
+
+
+def blank_cell(file_path, row, column):
+    """Empties the cell (row, column) of the csv-file file_path (written as
+    a new file: the old one might be a hard link). Returns the row and the
+    former value of the cell.
+    """
+    with file_path.open("r", newline="") as file:
+        rows = list(csv.reader(file))
+    value = float(rows[row][column])
+    rows[row][column] = ""
+    file_path.unlink()
+    with file_path.open("w", newline="") as file:
+        csv.writer(file).writerows(rows)
+    return rows[row], value
+
+
+def test_missing_values_count_as_zero(workspace):
+    """A blank cell of a province (county) doesn't blank its country
+    (state): It counts as 0, as in the groupby-sum of the original
+    preparation
+    """
+    file_paths = add_feeds(workspace, date, us_counties=2)
+    prepare_base_data(date)
+    name_to_iso3 = get_base_data(date, columns=("name", "iso3"))
+    days, countries, expected = read_feeds(date, name_to_iso3)
+
+    # Row 2: The first province of the first country (day 6), row 1: The
+    # first county of the first state (day 9, the days start after the
+    # combined key)
+    row, value = blank_cell(file_paths["confirmed"], 2, 4 + 6)
+    us_row, us_value = blank_cell(file_paths["confirmed_us"], 1, 11 + 9)
+    _, _, cube = read_feeds(date, name_to_iso3)
+
+    country = countries.index(name_to_iso3[row[1]])
+    state = countries.index(get_us_states()[us_row[6]])
+    expected[0, 6, country] -= value
+    expected[0, 6, -1] -= value
+    expected[0, 9, state] -= us_value
+    expected[3] = expected[0] - expected[2] - expected[1]
+    np.testing.assert_array_equal(cube, expected)
+
+
+def add_two_days(workspace, **kwargs):
+    """Writes the feeds of the test day and of the day before (the same
+    feeds without the last day)
+    """
+    file_paths = add_feeds(workspace, date, days=61, **kwargs)
+    for category, file_path in file_paths.items():
+        lines = file_path.read_text().splitlines()
+        if category != "base":
+            lines = [line.rsplit(",", 1)[0] for line in lines]
+        prev_file_path = get_feed_file_path(prev_date, category)
+        prev_file_path.write_text("\n".join(lines) + "\n")
+    return file_paths
+
+
+def load_cube(date):
+    """Loads the prepared cube of day date (as floats)"""
+    return to_floats(open_cube(date)[1])
+
+
+def test_changed_us_metadata_prepares_fully(workspace):
+    """A changed metadata column of the US feeds (here the combined key)
+    makes the feeds incomparable: The incremental preparation falls back to
+    the full one
+    """
+    file_paths = add_two_days(workspace, us_counties=2)
+    file_path = file_paths["confirmed_us"]
+    lines = file_path.read_text().splitlines()
+    lines[1] = lines[1].replace(', US"', ', USX"', 1)
+    file_path.unlink()
+    file_path.write_text("\n".join(lines) + "\n")
+
+    assert get_first_changed_day(date, prev_date, "confirmed_us") is None
+    prepare_data(prev_date, record_state=False)
+    prepare_data(date, incremental=True, record_state=False)
+    incremental = load_cube(date)
+    prepare_data(date, force=True, record_state=False)
+    np.testing.assert_array_equal(incremental, load_cube(date))
+
+
+def test_new_us_day_is_found(workspace):
+    """The first changed day of the US feeds is the first new day (the US
+    feeds have more metadata columns than the global ones)
+    """
+    add_two_days(workspace, us_counties=2)
+    for category in ("confirmed", "confirmed_us", "deaths_us"):
+        first_day = get_first_changed_day(date, prev_date, category)
+        assert first_day == pd.Timestamp("2020-03-22")
+
+
+def use_regions(regions):
+    """Replaces the regions of the current settings (see basics.get_region)"""
+    settings = get_settings()
+    use_settings(
+        replace(settings, files={**settings.files, "regions": regions})
+    )
+
+
+def test_changed_regions_prepare_again(workspace):
+    """The prepared data depend on the definition of the regions: Changed
+    regions aren't skipped as already prepared, and the aggregates and
+    their population sizes follow the new definition
+    """
+    add_feeds(workspace, date)
+    use_regions({"test": {"a": ["Q00"], "b": ["Q01", "Q02"]}})
+    prepare_data(date)
+    use_regions({"test": {"a": ["Q00", "Q01"], "b": ["Q02"]}})
+    prepare_data(date)
+
+    store = DataStore(date)
+    population = dict(zip(store.countries, store.population))
+    cum = store.get("confirmed", "cum")
+    for name, members in (("test.a", ["Q00", "Q01"]), ("test.b", ["Q02"])):
+        np.testing.assert_array_equal(cum[name], cum[members].sum(axis=1))
+        assert population[name] == sum(population[c] for c in members)
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tests.conftest import add_feeds, date, prev_date
+from utils.basics import get_categories, get_variants
+from utils.prepping import prepare_data
+from utils.storing import (
+    DataStore,
+    get_revisions,
+    load_vintages,
+    write_cube,
+)
+
+
+# Relative tolerance of the compact variants
+rtol = 1e-6
+
+
+def load_variants(compact):
+    """Prepares the data of the test day (with compact) and loads all
+    variants: Returns the data store and the arrays ((category, variant) ->
+    array)
+    """
+    prepare_data(date, force=True, compact=compact, record_state=False)
+    store = DataStore(date, cache_size=1000)
+    return store, {
+        (category, variant): store.get_values(category, variant).copy()
+        for category in get_categories()
+        for variant in get_variants(category)
+    }
+
+
+def test_compact_variants_within_tolerance(workspace):
+    """The plotted variants of compact stores have the same NaNs (missing
+    data, heads of the diffs and moving averages) as the full-precision
+    ones, and their values are within the tolerance (the cumulated counts
+    are exact). The compact stores keep half of the bytes.
+    """
+    add_feeds(workspace, date, countries=8, days=120, us_counties=1)
+    full_store, full = load_variants(False)
+    compact_store, compact = load_variants(True)
+
+    for key, values in full.items():
+        nans = np.isnan(values)
+        np.testing.assert_array_equal(np.isnan(compact[key]), nans)
+        np.testing.assert_allclose(
+            compact[key][~nans], values[~nans], rtol=rtol, atol=0
+        )
+        if key[1] == "cum":
+            np.testing.assert_array_equal(compact[key], values)
+
+    cached = [
+        sum(values.nbytes for values in store.cache.values())
+        for store in (full_store, compact_store)
+    ]
+    assert cached[1] <= 0.5 * cached[0]
+
+
+@pytest.mark.parametrize(
+    "variant, dtype",
+    [
+        ("cum", "int32"),
+        ("cum_rel_popmio", "float32"),
+        ("diff", "float32"),
+        ("diff_rel_active", "float32"),
+        ("diff_ma1w", "float32"),
+        ("diff_wow", "float32"),
+        ("diff_rel_pop100k_ema10d", "float32"),
+    ],
+)
+def test_compact_dtypes(workspace, variant, dtype):
+    """The downcasting rules of the variants (see DataStore.compact_dtypes)
+    are applied to the memo cache
+    """
+    add_feeds(workspace, date)
+    prepare_data(date, compact=True, record_state=False)
+    store = DataStore(date)
+    values = store.get_values("active", variant)
+    assert values.dtype.kind == "f"
+    assert store.cache["active", variant, None, 0].dtype == dtype
+
+
+def test_compact_counts_beyond_float32(workspace):
+    """Cumulated counts beyond 2**24 (not exact as 32-bit floats) are
+    loaded exactly from compact stores, missing values as NaN
+    """
+    categories = get_categories()
+    days = pd.date_range("2023-01-01", periods=3)
+    cube = np.full((len(categories), len(days), 2), 2.0**24 + 1)
+    cube[:, :, 1] += np.arange(len(days))
+    cube[:, 0, 0] = np.nan
+    write_cube(
+        date, categories, days, ["AAA", "TTL"], cube, {}, compact=True
+    )
+    values = DataStore(date).get_values("confirmed", "cum")
+    np.testing.assert_array_equal(values, cube[0])
+
+
+def test_vintages_without_countries(workspace):
+    """Countries an older vintage doesn't contain (here the US states) are
+    missing there instead of failing the comparison
+    """
+    add_feeds(workspace, prev_date)
+    add_feeds(workspace, date, us_counties=1)
+    for vintage in (prev_date, date):
+        prepare_data(vintage, record_state=False)
+
+    data = load_vintages(
+        [prev_date, date], "confirmed", "cum", ["Q00", "USA_AL"]
+    )
+    assert data["USA_AL", prev_date].isna().all()
+    assert data["USA_AL", date].notna().all()
+    assert data["Q00"].notna().all().all()
+    assert get_revisions(data).loc[("USA_AL", date), "days"] == 0
@@ -1,3 +1,39 @@
-from utils.basics import set_date
-from utils.prepping import download_data, prepare_data
-from utils.showing import show_countries, show_groups
+from importlib import import_module
+
+# Lazy facade: The functions are imported from their modules only when they
+# are accessed for the first time. The heavy dependencies (numpy, pandas,
+# matplotlib) are therefore only loaded if a stage which needs them runs,
+# and not for e.g. --help or download-only runs.
+
+# Function -> module which provides it
+functions = {
+    "set_date": "utils.basics",
+    "save_trace": "utils.basics",
+    "enable_tracing": "utils.tracing",
+    "download_data": "utils.downloading",
+    "prepare_data": "utils.prepping",
+    "backfill_data": "utils.prepping",
+    "show_countries": "utils.showing",
+    "show_groups": "utils.showing",
+    "show_vintages": "utils.showing",
+    "show_overview": "utils.showing",
+    "prune_plot_cache": "utils.basics",
+    "serve": "utils.serving",
+    "run_batch": "utils.batching",
+    "archive_data": "utils.archiving",
+    "restore_data": "utils.archiving",
+}
+
+__all__ = list(functions)
+
+
+def __getattr__(name):
+    if name not in functions:
+        raise AttributeError(f"module {__name__} has no attribute {name}")
+    function = getattr(import_module(functions[name]), name)
+    globals()[name] = function
+    return function
+
+
+def __dir__():
+    return sorted(set(globals()) | set(functions))
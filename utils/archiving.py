@@ -0,0 +1,406 @@
+import zlib
+
+from utils import tracing
+from utils.basics import *
+
+
+# Archiving: The data directories of the days (feeds and prepared data) are
+# nearly identical from one day to the next, so they are kept in a
+# content-addressed snapshot store (output_path/data/store):
+# - chunks/di/digest: The chunks of the files, zlib-compressed, named after
+#   the SHA-256 hash of their content. A chunk is stored only once, however
+#   many days contain it.
+# - snapshots/dte.json: The manifest of day dte: For every file (path
+#   relative to the data directory) its size, its hash, and its chunks.
+# The files are chunked along the axis they grow along: The feeds (CSV) get
+# a new column every day and are split into blocks of columns, the cube
+# gets new days and is split into blocks of days per category (see
+# storing). The other files are split into blocks of fixed size. A day is
+# restored (materialized) from its snapshot when its data are accessed (see
+# materialize_date). The latest days stay materialized (see archive_data),
+# reading them isn't affected at all.
+
+# Number of columns (feeds) or days (cube) per chunk, and the size of the
+# chunks of the other files
+block_size = 32
+chunk_size = 2**20
+
+
+def is_date(name):
+    """Checks if name is a day (yy-mm-dd), e.g. the name of a data
+    directory
+    """
+    try:
+        dt.datetime.strptime(name, "%y-%m-%d")
+    except ValueError:
+        return False
+    return True
+
+
+def split_fields(line):
+    """Splits the CSV line into its raw fields (quotes are kept): Commas
+    inside of quotes don't separate fields
+    """
+    pieces = line.split(",")
+    if '"' not in line:
+        return pieces
+    fields = []
+    for piece in pieces:
+        if fields and fields[-1].count('"') % 2 == 1:
+            fields[-1] += "," + piece
+        else:
+            fields.append(piece)
+    return fields
+
+
+def join_columns(chunks, newline):
+    """Joins the chunks of a CSV file split into blocks of columns (see
+    split_columns): Returns the content of the file
+    """
+    blocks = [chunk.decode("utf-8").split("\n") for chunk in chunks]
+    text = str.join("\n", map(",".join, zip(*blocks)))
+    return (text + "\n" if newline else text).encode("utf-8")
+
+
+def split_columns(content):
+    """Splits the content of a CSV file into blocks of block_size columns
+    (one chunk per block, its rows separated by newlines). Returns the chunks
+    and the layout of the file, or None if the file doesn't have the same
+    number of columns in every row (or isn't restored exactly)
+    """
+    try:
+        lines = content.decode("utf-8").split("\n")
+    except UnicodeDecodeError:
+        return None
+    newline = lines[-1] == ""
+    if newline:
+        lines.pop()
+    rows = [split_fields(line) for line in lines]
+    if not rows or any(len(row) != len(rows[0]) for row in rows):
+        return None
+
+    chunks = [
+        str.join(
+            "\n", (",".join(row[k:k + block_size]) for row in rows)
+        ).encode("utf-8")
+        for k in range(0, len(rows[0]), block_size)
+    ]
+    if join_columns(chunks, newline) != content:
+        return None
+    return chunks, {"layout": "columns", "newline": newline}
+
+
+def split_cube(content, header):
+    """Splits the content of a cube file (with the header) into blocks of
+    block_size days per category and variant (the cube is stored in the
+    order category, variant, day, country, see storing). Returns the chunks,
+    or None if the content doesn't match the header
+    """
+    categories, variants, days, countries = header["shape"]
+    row_size = countries * int(header["dtype"][2:])
+    if len(content) != categories * variants * days * row_size:
+        return None
+    chunks = []
+    for k in range(categories * variants):
+        offset = k * days * row_size
+        for day in range(0, days, block_size):
+            chunks.append(
+                content[
+                    offset + day * row_size:
+                    offset + min(day + block_size, days) * row_size
+                ]
+            )
+    return chunks
+
+
+def split_file(file_path, content):
+    """Splits the content of the file file_path into chunks, along the axis
+    the file grows along (see above). Returns the chunks and the layout of
+    the file.
+    """
+    if file_path.suffix == ".csv":
+        split = split_columns(content)
+        if split is not None:
+            return split
+
+    header_file_path = file_path.with_name(f"{file_path.stem}_header.json")
+    if file_path.suffix == ".bin" and header_file_path.exists():
+        with header_file_path.open("r") as file:
+            chunks = split_cube(content, json.load(file))
+        if chunks is not None:
+            return chunks, {"layout": "bytes"}
+
+    chunks = [
+        content[k:k + chunk_size] for k in range(0, len(content), chunk_size)
+    ]
+    return chunks, {"layout": "bytes"}
+
+
+def put_chunk(chunk):
+    """Stores the chunk (if not already stored) and returns its hash"""
+    digest = hashlib.sha256(chunk).hexdigest()
+    chunk_file_path = get_chunk_file_path(digest)
+    if not chunk_file_path.exists():
+        # Written under another name first: A chunk file is either complete
+        # or missing
+        temp_file_path = chunk_file_path.with_suffix(".tmp")
+        temp_file_path.write_bytes(zlib.compress(chunk))
+        temp_file_path.replace(chunk_file_path)
+        tracing.count("chunks stored")
+    return digest
+
+
+def get_chunk(digest):
+    """Provides the content of the chunk digest"""
+    return zlib.decompress(get_chunk_file_path(digest).read_bytes())
+
+
+def get_file_content(entry):
+    """Provides the content of the file with the manifest entry entry (see
+    snapshot_date), checked against its hash
+    """
+    chunks = [get_chunk(digest) for digest in entry["chunks"]]
+    if entry["layout"] == "columns":
+        content = join_columns(chunks, entry["newline"])
+    else:
+        content = b"".join(chunks)
+    if hashlib.sha256(content).hexdigest() != entry["sha256"]:
+        raise ValueError("Snapshot store corrupted: File hash mismatch")
+    return content
+
+
+def load_snapshot(date):
+    """Loads the manifest of the snapshot of day date, None if there's no
+    snapshot
+    """
+    snapshot_file_path = get_snapshot_file_path(date)
+    if not snapshot_file_path.exists():
+        return None
+    with snapshot_file_path.open("r") as file:
+        return json.load(file)
+
+
+def get_index_file_path():
+    """Provides the path to the index of the snapshots (day -> whether the
+    snapshot contains prepared data): snapshots/index.json
+    """
+    return get_snapshot_file_path("index")
+
+
+def load_index():
+    """Loads the index of the snapshots (see get_index_file_path)"""
+    index_file_path = get_index_file_path()
+    if not index_file_path.exists():
+        return {}
+    with index_file_path.open("r") as file:
+        return json.load(file)
+
+
+def get_archived_dates(prepared=False):
+    """Provides the (sorted) days which have a snapshot (with prepared=True
+    only the ones with prepared data)
+    """
+    return sorted(
+        date for date, entry in load_index().items()
+        if entry["prepared"] or not prepared
+    )
+
+
+def is_archived(date, prepared=False):
+    """Checks if day date has a snapshot (with prepared=True one with
+    prepared data), without restoring it
+    """
+    entry = load_index().get(date)
+    return entry is not None and (entry["prepared"] or not prepared)
+
+
+def has_data(dir_path):
+    """Checks if the data directory dir_path contains data: Feed files or a
+    (completely written) cube
+    """
+    return (dir_path / "data_header.json").exists() or any(
+        (dir_path / "feed").glob("*.csv")
+    )
+
+
+def get_materialized_dates():
+    """Provides the (sorted) days which have a data directory with data
+    (see has_data)
+    """
+    return sorted(
+        path.name
+        for path in get_dir_path("base_data").iterdir()
+        if path.is_dir() and is_date(path.name) and has_data(path)
+    )
+
+
+def write_json(file_path, content):
+    """Writes content into the JSON-file file_path: Under another name first,
+    i.e. the file is either complete or the old one
+    """
+    temp_file_path = file_path.with_suffix(".tmp")
+    with temp_file_path.open("w") as file:
+        json.dump(content, file, indent=4)
+    temp_file_path.replace(file_path)
+
+
+@tracing.traced
+def snapshot_date(date):
+    """Stores the files of the data directory of day date in the snapshot
+    store (only the chunks which aren't already stored) and writes the
+    manifest of the snapshot. Returns the manifest.
+    An existing snapshot isn't replaced by a directory without data (see
+    has_data), e.g. one that has been created for an archived day.
+    """
+    dir_path = get_dir_path("base_data") / date
+    snapshot = load_snapshot(date)
+    if snapshot is not None and not has_data(dir_path):
+        print_log(f"No data in the directory of {date}: Snapshot kept")
+        return snapshot
+    previous = (snapshot or {"files": {}})["files"]
+    files = {}
+    for file_path in sorted(dir_path.rglob("*")):
+        if not file_path.is_file():
+            continue
+        name = file_path.relative_to(dir_path).as_posix()
+        content = file_path.read_bytes()
+        digest = hashlib.sha256(content).hexdigest()
+
+        # Files which haven't changed since the last snapshot aren't split
+        # again
+        if previous.get(name, {}).get("sha256") == digest:
+            files[name] = previous[name]
+            continue
+        chunks, layout = split_file(file_path, content)
+        files[name] = {
+            "size": len(content),
+            "sha256": digest,
+            **layout,
+            "chunks": [put_chunk(chunk) for chunk in chunks],
+        }
+
+    manifest = {"date": date, "files": files}
+    write_json(get_snapshot_file_path(date), manifest)
+    index = load_index()
+    index[date] = {
+        "prepared": get_data_file_path(date, "data_header").name in files
+    }
+    write_json(get_index_file_path(), index)
+    return manifest
+
+
+@tracing.traced
+def restore_data(date):
+    """Restores the data directory of day date (feeds and prepared data) from
+    its snapshot, replacing the existing directory. The directory is written
+    under another name first and then renamed: It is either complete or
+    missing. Returns False if there's no snapshot of day date.
+    """
+    manifest = load_snapshot(date)
+    if manifest is None:
+        return False
+
+    print_log(f"Restoring data of {date} ...")
+    base_dir_path = get_dir_path("base_data")
+    temp_dir_path = base_dir_path / f".{date}.restore"
+    shutil.rmtree(temp_dir_path, ignore_errors=True)
+    temp_dir_path.mkdir()
+    for name, entry in manifest["files"].items():
+        file_path = temp_dir_path / name
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(get_file_content(entry))
+
+    dir_path = base_dir_path / date
+    shutil.rmtree(dir_path, ignore_errors=True)
+    get_settings().paths.forget_dir(dir_path)
+    temp_dir_path.replace(dir_path)
+    print_log(f"Data of {date} restored")
+    return True
+
+
+def materialize_date(date):
+    """Makes sure the data of day date are available as files: If there's no
+    data directory with data (see has_data) for date, but a snapshot, the
+    directory is restored. Returns True if it has been restored.
+    """
+    if has_data(get_dir_path("base_data") / date):
+        return False
+    return restore_data(date)
+
+
+def release_date(date):
+    """Removes the data directory of day date after it has been stored in
+    the snapshot store (see snapshot_date)
+    """
+    snapshot_date(date)
+    dir_path = get_dir_path("base_data") / date
+    shutil.rmtree(dir_path)
+    get_settings().paths.forget_dir(dir_path)
+
+
+def collect_garbage():
+    """Removes the chunks no snapshot refers to anymore (and the remains of
+    interrupted writes). Returns the number of removed chunks.
+    """
+    referenced = set()
+    for date in get_archived_dates():
+        manifest = load_snapshot(date) or {"files": {}}
+        for entry in manifest["files"].values():
+            referenced.update(entry["chunks"])
+
+    removed = 0
+    chunks_dir_path = get_dir_path("base_data") / "store" / "chunks"
+    for file_path in chunks_dir_path.glob("*/*"):
+        if file_path.name not in referenced:
+            file_path.unlink()
+            removed += 1
+    return removed
+
+
+def get_disk_usage(dir_path):
+    """Provides the bytes of the files in the directory dir_path (hard links
+    are counted once)
+    """
+    sizes = {}
+    for file_path in dir_path.rglob("*"):
+        if file_path.is_file():
+            stat = file_path.stat()
+            sizes[stat.st_dev, stat.st_ino] = stat.st_size
+    return sum(sizes.values())
+
+
+@tracing.traced
+def archive_data(keep=1):
+    """Compaction of the data directories: The directories of the days
+    before the latest keep days with prepared data are stored in the
+    snapshot store and removed (see release_date), then the chunks which
+    aren't needed anymore are removed (see collect_garbage). The released
+    days are restored on demand (see materialize_date) or with restore_data.
+    """
+    print_log("Archiving data ...")
+    base_dir_path = get_dir_path("base_data")
+    size = get_disk_usage(base_dir_path)
+
+    # The days after the kept ones (downloaded, but not prepared yet) stay,
+    # as do all days if there aren't keep days with prepared data
+    dates = get_materialized_dates()
+    prepared = [
+        date for date in dates
+        if (base_dir_path / date / "data_header.json").exists()
+    ]
+    if keep == 0:
+        released = dates
+    elif len(prepared) < keep:
+        released = []
+    else:
+        released = [date for date in dates if date < prepared[-keep]]
+    for date in released:
+        release_date(date)
+    removed = collect_garbage()
+
+    print_log(
+        f"Data archived: {len(released)} days released, "
+        f"{removed} chunks removed, "
+        f"{size / 2**20:.1f} MB -> "
+        f"{get_disk_usage(base_dir_path) / 2**20:.1f} MB"
+    )
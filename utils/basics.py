@@ -1,16 +1,158 @@
+from dataclasses import dataclass, field
 import datetime as dt
+import hashlib
 import json
+import os
 from pathlib import Path
+import shutil
 from sys import argv
 from time import strftime
 
+from utils import tracing
+
 
 # Logging (console)
 
 
 def print_log(message):
-    """Simple logging function: Adds timestamp before message"""
+    """Simple logging function: Adds timestamp before message (and records the
+    message in the trace, see tracing)
+    """
     print(strftime("%H:%M:%S") + ": " + message)
+    tracing.mark(message)
+
+
+# Settings: The settings files and the directory structure are loaded once
+# per process into an immutable Settings object, which is only replaced on
+# demand (reload_settings), e.g. in long-running processes after the
+# settings have been changed.
+
+
+@dataclass(frozen=True)
+class Paths:
+    """Directory structure used in the rest of the application:
+    - script_path/settings: For settings (json-files with parameters)
+    - output_path/data/dte/feed: For the raw downloaded data
+    - output_path/data/dte: For the prepared data
+    - output_path/plots/dte: For the generated plots
+    - output_path/traces: For the trace files (see tracing)
+    - output_path/data/store: For the snapshot store (see archiving)
+    The directories are created when they are requested for the first
+    time, the already created ones are remembered (created). I.e. the
+    dataclass is frozen (its directories can't be reassigned), but not
+    immutable: The memo is shared state of the process, which has to be
+    invalidated (see forget_dir) after a directory has been removed, by the
+    application (e.g. archiving) or outside of it.
+    """
+
+    settings_dir: Path
+    output_dir: Path
+    created: set = field(default_factory=set, compare=False, repr=False)
+
+    def make_dir(self, path):
+        """Creates the directory path (if not already done) and returns it"""
+        if path not in self.created:
+            path.mkdir(parents=True, exist_ok=True)
+            self.created.add(path)
+        return path
+
+    def forget_dir(self, path=None):
+        """Invalidates the memo of the created directories: Forgets the
+        directory path and its subdirectories (default: all directories)
+        after they have been removed, they are created again when requested
+        """
+        if path is None:
+            self.created.clear()
+            return
+        self.created.difference_update(
+            [known for known in self.created
+             if known == path or path in known.parents]
+        )
+
+    def get_dir_path(self, key, date=None):
+        """Provides (and creates) the directory key (see Paths) of day
+        date
+        """
+        if key == "settings":
+            return self.settings_dir
+        if key in ["base_data", "base_plots"]:
+            path = self.output_dir / key[5:]
+        elif key == "traces":
+            path = self.output_dir / key
+        elif key in ["data", "plots"]:
+            path = self.output_dir / key / date
+        elif key == "feed":
+            path = self.output_dir / "data" / date / key
+        else:
+            path = self.output_dir
+        return self.make_dir(path)
+
+
+@dataclass(frozen=True)
+class Settings:
+    """The contents of the settings files (name -> parsed json-file, e.g.
+    urls, regions, title_translation) and the directory structure (see
+    Paths). The contents are shared and must be treated as read-only.
+    """
+
+    paths: Paths
+    files: dict
+
+    def get(self, name):
+        """Returns the content of the settings file name"""
+        return self.files[name]
+
+
+def load_settings(script_dir=None):
+    """Loads the settings: The settings directory is the subdirectory
+    "settings" of the script directory script_dir (default: the directory in
+    which the script is located). The output directory is either stored in
+    its "output_dir.json"-file or the script directory.
+    """
+    if script_dir is None:
+        script_dir = Path(argv[0]).parent
+    settings_dir = script_dir / "settings"
+    files = {}
+    if settings_dir.is_dir():
+        for file_path in sorted(settings_dir.glob("*.json")):
+            with file_path.open("r") as file:
+                files[file_path.stem] = json.load(file)
+
+    output_dir = script_dir
+    if files.get("output_dir", {}).get("OUTPUT_DIR", "") != "":
+        output_dir = Path(files["output_dir"]["OUTPUT_DIR"])
+
+    return Settings(paths=Paths(settings_dir, output_dir), files=files)
+
+
+# Settings of the current process (see get_settings)
+current_settings = None
+
+
+def get_settings():
+    """Provides the settings of the current process: They are loaded with
+    the first request
+    """
+    global current_settings
+    if current_settings is None:
+        current_settings = load_settings()
+    return current_settings
+
+
+def reload_settings():
+    """Reloads the settings (e.g. after the settings files have been
+    changed) and returns them
+    """
+    return use_settings(load_settings())
+
+
+def use_settings(new_settings):
+    """Makes new_settings the settings of the current process (e.g. the
+    settings passed to a worker process) and returns them
+    """
+    global current_settings
+    current_settings = new_settings
+    return current_settings
 
 
 # Basic structures
@@ -34,71 +176,89 @@ def get_categories():
     return ["confirmed", "deaths", "recovered", "active"]
 
 
+def get_windows():
+    """Provides the windows of the windowed statistics (see get_variants),
+    e.g. 1w (1 week), 2w, 4w, or 10d (10 days), from the settings file
+    windows.json
+    """
+    return get_settings().get("windows")
+
+
+def get_window_days(window):
+    """Provides the number of days of the window (e.g. 2w -> 14, 10d -> 10)
+    """
+    return int(window[:-1]) * {"w": 7, "d": 1}[window[-1]]
+
+
 def get_variants(category):
-    """Provides the different data variants"""
-    variants = [
-        "cum",
-        "cum_rel_popmio",
-        "cum_rel_pop100k",
-        "diff",
-        "diff_rel_popmio",
-        "diff_rel_pop100k",
-        "diff_ma1w",
-        "diff_rel_popmio_ma1w",
-        "diff_rel_pop100k_ma1w",
-        "diff_rel_active",
-    ]
+    """Provides the different data variants:
+    - cum(_rel_<scale>): Cumulated data (relative to the population scale
+      popmio or pop100k)
+    - diff(_rel_<scale>): 1-day differences
+    - diff(_rel_<scale>)_<statistic><window>: Windowed statistics of the
+      differences, for the windows of get_windows (e.g. diff_ma2w):
+      ma (moving average), sum (moving sum), and ema (exponential moving
+      average)
+    - diff_wow: Week-over-week ratio of the differences (sum of the last 7
+      days relative to the sum of the 7 days before)
+    - diff_rel_active: Differences relative to the active cases of the day
+      before (only for active)
+    """
+    diffs = ["diff", "diff_rel_popmio", "diff_rel_pop100k"]
+    variants = ["cum", "cum_rel_popmio", "cum_rel_pop100k"] + diffs
+    variants += [f"{diff}_ma1w" for diff in diffs]
+    for statistic in ("ma", "sum", "ema"):
+        for window in get_windows():
+            variants += [
+                f"{diff}_{statistic}{window}" for diff in diffs
+                if f"{diff}_{statistic}{window}" not in variants
+            ]
+    variants.append("diff_wow")
     if category == "active":
-        return variants
-    return variants[:-1]
+        variants.append("diff_rel_active")
+    return variants
+
+
+def get_us_states():
+    """Provides the US states (and territories) whose data are taken from the
+    county-level US feeds: Dictionary state name -> key of the state in the
+    data, e.g. California -> USA_CA (see settings file us_states.json)
+    """
+    return {
+        state: f"USA_{code}"
+        for state, code in get_settings().get("us_states").items()
+    }
 
 
 # Web-related information
 
 
+def get_feed_categories():
+    """Provides the categories of the feeds which are downloaded: The lookup
+    table (base), the global time series (confirmed, deaths, recovered),
+    and, if their urls are set up, the US county-level time series
+    (confirmed_us, deaths_us)
+    """
+    urls = get_settings().get("urls")
+    return ["base"] + get_categories()[:-1] + [
+        category for category in ("confirmed_us", "deaths_us")
+        if category in urls
+    ]
+
+
 def get_feed_url(category):
     """Provides the data urls of John Hopkins University's GitHub project
     (confirmed, deaths, recovered)
     """
-    with get_settings_file_path("urls").open("r") as file:
-        return json.load(file)[category]
+    return get_settings().get("urls")[category]
 
 
 # Paths and files
 
 
 def get_dir_path(key, date=None):
-    """Sets up the directory structure used in the rest of the application:
-    - script_path/settings: For settings (json-files with parameters)
-    - output_path/data/dte/feed: For the raw downloaded data
-    - output_path/data/dte: For the prepared data
-    - output_path/plots/dte: For the generated plots
-    """
-    # Determine settings directory: Subdirectory of the directory in which the
-    # script is located, named "settings"
-    if key == "settings":
-        return Path(argv[0]).parent / key
-
-    # Determine the output directory: Either stored in the "output_dir.json"-
-    # file located in the settings directory or the directory in which the
-    # script is located
-    path = Path(argv[0]).parent
-    if get_settings_file_path("output_dir").exists():
-        with get_settings_file_path("output_dir").open("r") as file:
-            settings = json.load(file)
-        if settings["OUTPUT_DIR"] != "":
-            path = Path(settings["OUTPUT_DIR"])
-
-    # Output directories
-    if key in ["base_data", "base_plots"]:
-        path = path / key[5:]
-    elif key in ["data", "plots"]:
-        path = get_dir_path("base" + "_" + key) / date
-    elif key == "feed":
-        path = get_dir_path("data", date) / key
-    path.mkdir(parents=True, exist_ok=True)
-
-    return path
+    """Provides the directories of the application (see Paths)"""
+    return get_settings().paths.get_dir_path(key, date)
 
 
 def get_settings_file_path(key):
@@ -122,19 +282,117 @@ def get_data_file_path(date, name="data", file_format="json"):
     return get_dir_path("data", date) / f"{name}.{file_format}"
 
 
-def get_plot_file_path(date, base, *args):
+def get_plot_file_path(
+    date, base, *args, file_format="png", profile="default", folder=None
+):
     """Provides the path to the plot-file generated from day dte-data, defined
-    by the categories and variants specified in *args
+    by the categories and variants specified in *args, in the file format
+    file_format (png, webp, svg). Plots of other render profiles than the
+    default are placed in a subfolder named after the profile. The plots are
+    placed in the folder of day date (output_path/plots/dte), or in folder.
     """
     filename = base
     for arg in args:
         filename += "_" + arg
-    filename += ".png"
+    filename += "." + file_format
+
+    if folder is None:
+        folder = get_dir_path("plots", date)
+    path = folder.joinpath(base)
+    if profile != "default":
+        path = path.joinpath(profile)
+
+    return get_settings().paths.make_dir(path).joinpath(filename)
+
+
+def get_state_file_path():
+    """Provides the path to the JSON-file which keeps track of the state of
+    the feeds (ETag, Last-Modified, content hash of the last download) and of
+    the last data preparation: output_path/data/feed_state.json
+    """
+    return get_dir_path("base_data") / "feed_state.json"
+
+
+def get_trace_file_paths(date):
+    """Provides the paths to the files of a trace (summary and Chrome-trace)
+    of a run for day date: output_path/traces/dte_HHMMSS_summary.json and
+    output_path/traces/dte_HHMMSS_trace.json
+    """
+    path = get_dir_path("traces")
+    name = f"{date}_{strftime('%H%M%S')}"
+    return path / f"{name}_summary.json", path / f"{name}_trace.json"
+
+
+def save_trace(date):
+    """Writes the trace (if tracing is enabled) of the run for day date into
+    its files (see get_trace_file_paths)
+    """
+    if tracing.is_tracing():
+        summary_file_path, trace_file_path = get_trace_file_paths(date)
+        tracing.write_trace(summary_file_path, trace_file_path)
+        print_log(f"Trace written: {trace_file_path}")
 
-    path = get_dir_path("plots", date).joinpath(base)
-    path.mkdir(parents=True, exist_ok=True)
 
-    return path.joinpath(filename)
+def get_file_hash(file_path, chunk_size=1 << 16):
+    """Provides the SHA-256 hash (hex digest) of the content of the file"""
+    file_hash = hashlib.sha256()
+    with file_path.open("rb") as file:
+        while chunk := file.read(chunk_size):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def link_file(source_path, target_path):
+    """Makes the file target_path a hard link of the file source_path, or a
+    copy if hard links aren't possible (e.g. different file systems)
+    """
+    target_path.unlink(missing_ok=True)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copy2(source_path, target_path)
+
+
+def get_plot_cache_file_path(digest, file_format="png"):
+    """Provides the path to the file of the plot with the content hash digest
+    in the plot cache: output_path/plots/cache/digest.file_format
+    """
+    path = get_dir_path("base_plots") / "cache"
+    return get_settings().paths.make_dir(path) / f"{digest}.{file_format}"
+
+
+def prune_plot_cache():
+    """Removes the figures from the plot cache which aren't linked from any
+    plot directory anymore (e.g. after the plot directories of old days or
+    of the server have been removed): Their files have no other hard link.
+    If the file system doesn't support hard links the cache is emptied.
+    Returns the number of removed figures.
+    """
+    removed = 0
+    for file_path in (get_dir_path("base_plots") / "cache").glob("*.*"):
+        if file_path.stat().st_nlink == 1:
+            file_path.unlink()
+            removed += 1
+    if removed > 0:
+        print_log(f"Plot cache pruned: {removed} figures removed")
+    return removed
+
+
+def get_chunk_file_path(digest):
+    """Provides the path to the file of the chunk with the content hash digest
+    in the snapshot store (see archiving):
+    output_path/data/store/chunks/di/digest
+    """
+    path = get_dir_path("base_data") / "store" / "chunks" / digest[:2]
+    return get_settings().paths.make_dir(path) / digest
+
+
+def get_snapshot_file_path(date):
+    """Provides the path to the manifest of the snapshot of day date in the
+    snapshot store (see archiving): output_path/data/store/snapshots/dte.json
+    """
+    path = get_dir_path("base_data") / "store" / "snapshots"
+    return get_settings().paths.make_dir(path) / f"{date}.json"
 
 
 def get_region(region, subregion="-"):
@@ -142,5 +400,51 @@ def get_region(region, subregion="-"):
     south, east, north, ...). Definitions are stored in the settings file
     regions.json in the folder ../settings.
     """
-    with get_settings_file_path("regions").open("r") as file:
-        return json.load(file)[region][subregion]
+    return list(get_settings().get("regions")[region][subregion])
+
+
+def get_region_aggregates():
+    """Provides the region aggregates, which are prepared like countries
+    (see prepping.add_region_aggregates): Dictionary name -> countries (see
+    get_region), named region.subregion (e.g. europe.west) for the
+    subregions and region.all for the whole regions (e.g. europe.all)
+    """
+    aggregates = {}
+    for region, subregions in get_settings().get("regions").items():
+        for subregion in subregions:
+            if subregion != "-":
+                aggregates[f"{region}.{subregion}"] = get_region(
+                    region, subregion
+                )
+        aggregates[f"{region}.all"] = list(
+            dict.fromkeys(
+                country
+                for subregion in subregions
+                for country in get_region(region, subregion)
+            )
+        )
+    return aggregates
+
+
+def is_aggregate(country):
+    """Checks if country is a region aggregate (see get_region_aggregates)"""
+    return "." in country
+
+
+def is_subnational(country):
+    """Checks if country is a part of a country, i.e. a US state (see
+    get_us_states), which is also contained in its country
+    """
+    return country.startswith("USA_")
+
+
+def is_country(country):
+    """Checks if country is a single country: Neither a region aggregate
+    (see is_aggregate), a part of a country (see is_subnational), nor the
+    total of all countries (TTL)
+    """
+    return (
+        country != "TTL"
+        and not is_aggregate(country)
+        and not is_subnational(country)
+    )
@@ -0,0 +1,198 @@
+from utils import tracing
+from utils.basics import *
+from utils.showing import (
+    get_render_profile,
+    show_countries,
+    show_countries_beyond_threshold,
+    show_groups,
+)
+
+
+# Batching: A batch file (JSON, or YAML if PyYAML is installed) lists jobs,
+# which are executed as one plan. Example (JSON):
+# {
+#     "length": 365,
+#     "profile": "default",
+#     "jobs": [
+#         {"countries": ["DEU", "europe/west"]},
+#         {"groups": ["DEU-FRA", "europe/north", {"DACH": ["DEU", "AUT"]}]},
+#         {"countries": ["europe"], "profile": "web", "length": 90},
+#         {"thresholds": [{"category": "deaths", "variant": "cum",
+#                          "threshold": 100, "countries": ["europe"]}]}
+#     ]
+# }
+# - countries: Countries (iso codes) and regions
+# - groups: Groups of countries, written as in the command line (DEU-FRA),
+#   as regions (a group named after the region, e.g. europe west), or as
+#   dictionary (group name -> countries and regions)
+# - thresholds: Plots of the countries and regions aligned at the days they
+#   exceed the threshold in category and variant (see
+#   showing.show_countries_beyond_threshold), without countries: all single
+#   countries (see basics.is_country)
+# - length and profile: Number of days and render profile of a job, the
+#   defaults are taken from the top level of the file (and from there from
+#   the command line)
+# Regions are references to the settings file regions.json: region/subregion
+# (e.g. europe/west), or just region (e.g. europe, all of its subregions).
+# They stand for their countries, the prepared region aggregates (see
+# basics.get_region_aggregates) are listed like countries (e.g. europe.west).
+# The plan combines the jobs with the same length and profile: Every country,
+# group, and threshold plot is plotted only once, even if it appears in
+# several jobs, and the series of all countries (and of all groups) are
+# loaded together.
+
+
+def load_batch(file_path):
+    """Loads the batch file file_path: YAML if its suffix is .yaml or .yml
+    (requires PyYAML), otherwise JSON
+    """
+    with file_path.open("r") as file:
+        if file_path.suffix in (".yaml", ".yml"):
+            import yaml
+
+            return yaml.safe_load(file)
+        return json.load(file)
+
+
+def is_region(reference):
+    """Checks if reference (e.g. europe/west, or DEU) refers to a region"""
+    return reference.split("/")[0] in get_settings().get("regions")
+
+
+def expand_region(reference):
+    """Provides the countries of the region reference: region/subregion
+    (e.g. europe/west), or region for all of its subregions (e.g. europe).
+    Raises ValueError for unknown regions.
+    """
+    regions = get_settings().get("regions")
+    region, _, subregion = reference.partition("/")
+    if region not in regions or (
+        subregion and subregion not in regions[region]
+    ):
+        raise ValueError(f"Unknown region {reference}")
+    if subregion:
+        return get_region(region, subregion)
+    return list(
+        dict.fromkeys(
+            country
+            for subregion in regions[region]
+            for country in get_region(region, subregion)
+        )
+    )
+
+
+def expand_countries(references):
+    """Provides the countries (without duplicates) of the references, which
+    are countries (iso codes) and regions (see expand_region)
+    """
+    countries = []
+    for reference in references:
+        if is_region(reference):
+            countries += expand_region(reference)
+        else:
+            countries.append(reference)
+    return list(dict.fromkeys(countries))
+
+
+def expand_groups(specs):
+    """Provides the groups (group name -> countries) of the group specs (see
+    the batch file)
+    """
+    groups = {}
+    for spec in specs:
+        if isinstance(spec, dict):
+            items = [
+                (name, expand_countries(references))
+                for name, references in spec.items()
+            ]
+        elif is_region(spec):
+            items = [(spec.replace("/", " "), expand_region(spec))]
+        else:
+            items = [(" vs. ".join(spec.split("-")), spec.split("-"))]
+        for name, countries in items:
+            if groups.setdefault(name, countries) != countries:
+                raise ValueError(f"Group {name} defined differently")
+    return groups
+
+
+def expand_thresholds(specs):
+    """Provides the threshold plots (category, variant, threshold,
+    countries) of the threshold specs (see the batch file)
+    """
+    return [
+        (
+            spec["category"],
+            spec["variant"],
+            spec["threshold"],
+            tuple(expand_countries(spec.get("countries", []))),
+        )
+        for spec in specs
+    ]
+
+
+def make_plan(batch, length=365, profile="default"):
+    """Makes the plan of the batch (see load_batch): Dictionary (length,
+    profile) -> {"countries": countries, "groups": groups, "thresholds":
+    threshold plots}, which contains every country, every group, and every
+    threshold plot only once. length and profile are the
+    defaults (if not defined in the batch).
+    """
+    length = batch.get("length", length)
+    profile = batch.get("profile", profile)
+    plan = {}
+    requested = 0
+    for job in batch.get("jobs", []):
+        key = job.get("length", length), job.get("profile", profile)
+        get_render_profile(key[1])
+        step = plan.setdefault(
+            key, {"countries": [], "groups": {}, "thresholds": []}
+        )
+        countries = expand_countries(job.get("countries", []))
+        groups = expand_groups(job.get("groups", []))
+        thresholds = expand_thresholds(job.get("thresholds", []))
+        requested += len(countries) + len(groups) + len(thresholds)
+        step["countries"] = list(dict.fromkeys(step["countries"] + countries))
+        step["thresholds"] = list(
+            dict.fromkeys(step["thresholds"] + thresholds)
+        )
+        for name, members in groups.items():
+            if step["groups"].setdefault(name, members) != members:
+                raise ValueError(f"Group {name} defined differently")
+
+    planned = sum(
+        len(step["countries"]) + len(step["groups"]) + len(step["thresholds"])
+        for step in plan.values()
+    )
+    print_log(
+        f"Batch plan: {len(batch.get('jobs', []))} jobs, {planned} plot sets "
+        f"({requested - planned} duplicates skipped)"
+    )
+    return plan
+
+
+@tracing.traced
+def run_batch(date, file_path, length=365, jobs=1, profile="default"):
+    """Executes the batch file file_path (see load_batch) for day date as one
+    plan (see make_plan): The countries and the groups of every length and
+    render profile are plotted together (see show_countries and
+    show_groups), with jobs worker processes. length and profile are the
+    defaults of the batch.
+    """
+    plan = make_plan(load_batch(Path(file_path)), length, profile)
+    for (length, profile), step in plan.items():
+        if step["countries"]:
+            show_countries(
+                date,
+                *step["countries"],
+                length=length,
+                jobs=jobs,
+                profile=profile,
+            )
+        if step["groups"]:
+            show_groups(
+                date, step["groups"], length=length, jobs=jobs, profile=profile
+            )
+        for category, variant, threshold, countries in step["thresholds"]:
+            show_countries_beyond_threshold(
+                date, category, variant, threshold, *countries, profile=profile
+            )
@@ -0,0 +1,142 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from time import perf_counter
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from utils import tracing
+from utils.archiving import materialize_date
+from utils.basics import *
+
+
+# Keeping track of the feeds and the prepared data
+
+
+def get_state():
+    """Loads the state manifest (see get_state_file_path):
+    - feeds: url -> ETag, Last-Modified, SHA-256 hash of the content, and
+      the date of the directory which holds the last downloaded feed file
+    - prepared: date of the last data preparation and the SHA-256 hashes of
+      the feed files it is based on
+    """
+    file_path = get_state_file_path()
+    if not file_path.exists():
+        return {"feeds": {}, "prepared": {}}
+    with file_path.open("r") as file:
+        return json.load(file)
+
+
+def save_state(state):
+    """Writes the state manifest (see get_state)"""
+    with get_state_file_path().open("w") as file:
+        json.dump(state, file, indent=4)
+
+
+# Retrieving data from github repository
+
+
+def download_feed(url, file_path, state=None, chunk_size=1 << 16, timeout=60):
+    """Streams the data behind url in chunks of chunk_size bytes into the file
+    file_path. The data are first written into a temporary file next to the
+    target, which then replaces the target: An interrupted download doesn't
+    leave a truncated feed file behind.
+    If the state of the feed from an earlier download is provided the
+    request is conditional (ETag/Last-Modified). Returns the new state of the
+    feed and the number of bytes written, which is None if the server
+    reported the feed as not modified (nothing has been written then).
+    """
+    request = Request(url)
+    if state is not None:
+        if state.get("etag"):
+            request.add_header("If-None-Match", state["etag"])
+        if state.get("last_modified"):
+            request.add_header("If-Modified-Since", state["last_modified"])
+
+    tmp_file_path = file_path.with_name(file_path.name + ".part")
+    content_hash = hashlib.sha256()
+    size = 0
+    try:
+        with urlopen(request, timeout=timeout) as r:
+            with tmp_file_path.open("wb") as file:
+                while chunk := r.read(chunk_size):
+                    file.write(chunk)
+                    content_hash.update(chunk)
+                    size += len(chunk)
+            headers = r.headers
+    except HTTPError as error:
+        if state is not None and error.code == 304:
+            return state, None
+        raise
+    tmp_file_path.replace(file_path)
+
+    return {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "sha256": content_hash.hexdigest(),
+    }, size
+
+
+@tracing.traced
+def download_data(date=None, urls=None, max_workers=4):
+    """Downloads the data from the JHU GitHub repository into feed files. The
+    feeds (base, confirmed, deaths, recovered, and the US feeds, see
+    basics.get_feed_categories) are fetched concurrently by a pool of at
+    most max_workers threads. The urls default to the ones in the settings
+    file urls.json, but can be provided as a dictionary (category -> url),
+    e.g. to download from a local server.
+    The requests are conditional on the state of the last download: Feeds
+    which haven't been modified since then aren't downloaded again, the
+    already available feed files are reused instead.
+    """
+    print_log("Downloading data from JHU repository ...")
+    date = set_date(date)
+
+    # The feeds are downloaded into the directory of an archived day only
+    # after it has been restored (see archiving.materialize_date)
+    materialize_date(date)
+    if urls is None:
+        urls = {
+            category: get_feed_url(category)
+            for category in get_feed_categories()
+        }
+    categories = list(urls)
+    state = get_state()
+
+    def download(category):
+        url = urls[category]
+        file_path = get_feed_file_path(date, category)
+
+        # Conditional request only if the last downloaded file still exists
+        feed_state = state["feeds"].get(url)
+        if feed_state is not None:
+            last_file_path = get_feed_file_path(feed_state["date"], category)
+            if not last_file_path.exists():
+                feed_state = None
+
+        start = perf_counter()
+        with tracing.span("download_feed", category=category):
+            feed_state, size = download_feed(url, file_path, state=feed_state)
+        if size is None:
+            if feed_state["date"] != date:
+                link_file(last_file_path, file_path)
+            print_log(f"Feed {category} not modified")
+        else:
+            tracing.count("bytes downloaded", size)
+            print_log(
+                f"Feed {category} downloaded: "
+                f"{size:,} bytes in {perf_counter() - start:.2f} s"
+            )
+
+        return url, {**feed_state, "date": date}
+
+    # The downloads are I/O-bound, so threads are sufficient. Retrieving the
+    # results re-raises any exception that occurred during a download.
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in [
+            executor.submit(download, category) for category in categories
+        ]:
+            url, feed_state = future.result()
+            state["feeds"][url] = feed_state
+    save_state(state)
+
+    print_log("Download finished")
@@ -1,54 +1,58 @@
-from urllib.request import urlopen
+from concurrent.futures import ProcessPoolExecutor
+import csv
+from functools import partial
+import hashlib
+from time import perf_counter
+
+import numpy as np
 import pandas as pd
 
+from utils import tracing
+from utils.archiving import get_materialized_dates, materialize_date
 from utils.basics import *
-
-
-# Retrieving data from github repository
-
-
-def download_data():
-    """Downloads the data from the JHU GitHub repository into feed files"""
-    print_log("Downloading data from JHU repository ...")
-    today = set_date()
-    categories = ["base"] + get_categories()[:-1]
-    for category in categories:
-        # Establish access to data on the web and load them
-        with urlopen(get_feed_url(category)) as r:
-            data = r.read().decode("utf-8")
-
-        # Write data into the feed files
-        with get_feed_file_path(today, category).open("w", newline="") as file:
-            file.write(data)
-
-    print_log("Download finished")
+from utils.downloading import get_state, save_state
+from utils.storing import (
+    DataStore,
+    cube_exists,
+    get_prepared_dates,
+    load_cube_header,
+    open_cube,
+    to_floats,
+    write_cube,
+)
 
 
 # Preparing data for further usage
 
 
+@tracing.traced
 def prepare_base_data(date):
     """Prepares the basic data: How to name countries (ISO3, full name, and
-    population size)
+    population size), including the US states (see basics.get_us_states)
     """
     # Reading the feed csv-file into a DataFrame, taking only the necessary
-    # columns (2 = ISO3-codes, 6 = province/state name, 7 = country name,
-    # 11 = population size
-    df = pd.read_csv(
-        str(get_feed_file_path(date, "base")), usecols=[2, 6, 7, 11]
+    # columns (2 = ISO3-codes, 5 = county name, 6 = province/state name,
+    # 7 = country name, 11 = population size
+    lookup = pd.read_csv(
+        str(get_feed_file_path(date, "base")), usecols=[2, 5, 6, 7, 11]
     )
 
+    # The US states: Rows of the country US with a state but without a county
+    us_states = get_us_states()
+    states = lookup[
+        (lookup.iloc[:, 3] == "US")
+        & lookup.iloc[:, 1].isna()
+        & lookup.iloc[:, 2].isin(us_states)
+    ]
+    df = lookup.drop(columns=[lookup.columns[1]])
+
     # Dropping of:
     # - rows with 1. column (no ISO3-code) empty or 2. column
     #   ('Province_State') not empty (additional information on a sub-country
     #   level)
     # - column 2 (only used for filtering out unnecessary rows)
-    drop_rows = [
-        r
-        for r in df.index
-        if pd.isna(df.iat[r, 0]) or not pd.isna(df.iat[r, 1])
-    ]
-    df = df.drop(index=drop_rows, columns=[df.columns[1]])
+    df = df[df.iloc[:, 0].notna() & df.iloc[:, 1].isna()]
+    df = df.drop(columns=[df.columns[1]])
 
     # Dumping frame in dictionary
     df.columns = ["iso3", "name", "pop"]
@@ -69,14 +73,57 @@ def prepare_base_data(date):
             "pop": df["pop"].sum(axis="index"),
         },
     ]
+    countries += [
+        {"iso3": us_states[state], "name": f"{state}, US", "pop": pop}
+        for state, pop in zip(states.iloc[:, 2], states.iloc[:, 4])
+    ]
+
+    # Adding the region aggregates (see add_region_aggregates): Their
+    # population sizes are aggregated the same way as their data
+    aggregates = get_region_aggregates()
+    population = aggregate_countries(
+        np.array([country["pop"] for country in countries], dtype="float64"),
+        get_membership_matrix(
+            aggregates, [country["iso3"] for country in countries]
+        ),
+    )
+    countries += [
+        {
+            "iso3": name,
+            "name": get_aggregate_name(name),
+            "pop": None if np.isnan(pop) else float(pop),
+        }
+        for name, pop in zip(aggregates, population)
+    ]
 
     # Sorting alphabetically along iso3 code
     countries.sort(key=(lambda item: item["iso3"]))
 
     # # Writing the table in the file data_base.csv in data folder of dte
-    json.dump(
-        countries, get_data_file_path(date, name="base").open("w"), indent=4
-    )
+    # (removing the old file first: It might be a hard link to the file of
+    # another day, see reuse_prepared_data)
+    file_path = get_data_file_path(date, name="base")
+    file_path.unlink(missing_ok=True)
+    with file_path.open("w") as file:
+        json.dump(countries, file, indent=4)
+
+
+# Process-wide cache of the base data: date -> (file state, countries)
+base_data = {}
+
+
+def load_base_data(date):
+    """Provides the base data (list of the countries) of day date from the
+    process-wide cache, which is keyed by the date and the state
+    (modification time, inode) of the base data file
+    """
+    file_path = get_data_file_path(date, name="base")
+    stat = file_path.stat()
+    file_state = stat.st_mtime_ns, stat.st_ino
+    if date not in base_data or base_data[date][0] != file_state:
+        with tracing.span("load_base_data"), file_path.open("r") as file:
+            base_data[date] = file_state, json.load(file)
+    return base_data[date][1]
 
 
 def get_base_data(date, columns=("iso3", "name", "pop")):
@@ -86,10 +133,7 @@ def get_base_data(date, columns=("iso3", "name", "pop")):
     there's no inner dictionary: The values to the keys are the values of the
     of the 2. column.
     """
-    countries = json.load(
-        get_data_file_path(date, name="base").open("r"),
-        object_hook=lambda obj: {column: obj[column] for column in columns},
-    )
+    countries = load_base_data(date)
 
     if len(columns) == 2:
         return {
@@ -103,136 +147,632 @@ def get_base_data(date, columns=("iso3", "name", "pop")):
     }
 
 
-def prepare_data(date, excel_output=False):
-    """Actual data preparation (see the comments for details)"""
-    print_log("Preparing data ...")
+def get_aggregate_name(name):
+    """Provides the (display) name of the region aggregate name (see
+    basics.get_region_aggregates), e.g. europe.west -> Europe (west)
+    """
+    region, subregion = name.split(".")
+    if subregion == "all":
+        return region.title()
+    return f"{region.title()} ({subregion})"
 
-    # Preparing the base data (name, keys, pop-numbers)
-    prepare_base_data(date)
 
-    # Getting a dictionary that translates country names in iso3-code
-    name_to_iso3 = get_base_data(date, columns=("name", "iso3"))
+def get_membership_matrix(aggregates, countries):
+    """Provides the membership matrix of the aggregates (dictionary name ->
+    member countries) over the countries: Entry (k, j) is 1 if country j is
+    a member of the k-th aggregate, otherwise 0. Members which aren't among
+    the countries are ignored.
+    """
+    index = {country: j for j, country in enumerate(countries)}
+    membership = np.zeros((len(aggregates), len(countries)))
+    for k, members in enumerate(aggregates.values()):
+        membership[k, [index[c] for c in members if c in index]] = 1
+    return membership
+
+
+def aggregate_countries(values, membership):
+    """Aggregates (sums up) values along the last axis (the countries) with
+    the membership matrix (see get_membership_matrix): One matrix multiply
+    for all aggregates, days, and categories. Missing values (NaN) count as
+    0, an aggregate is only missing if all of its members are.
+    """
+    present = ~np.isnan(values)
+    sums = np.where(present, values, 0) @ membership.T
+    counts = present @ membership.T
+    return np.where(counts > 0, sums, np.nan)
+
+
+@tracing.traced
+def add_region_aggregates(days, countries, cube):
+    """Adds the region aggregates (see basics.get_region_aggregates) as
+    additional countries (after TTL) to the cumulated data (days, countries,
+    cube with the axes (category, day, country), see aggregate_countries).
+    Aggregates already contained (e.g. after an incremental preparation) are
+    computed anew. Returns the days, the countries, and the cube. (The
+    population sizes of the aggregates are part of the base data, see
+    prepare_base_data.)
+    """
+    keep = [
+        j for j, country in enumerate(countries) if not is_aggregate(country)
+    ]
+    countries = [countries[j] for j in keep]
+    aggregates = get_region_aggregates()
+    membership = get_membership_matrix(aggregates, countries)
+
+    # Filling the extended cube category by category (the temporaries of
+    # aggregate_countries are only as large as one category)
+    extended = np.empty((*cube.shape[:-1], len(keep) + len(aggregates)))
+    for values, category in zip(extended, cube):
+        values[:, : len(keep)] = category[:, keep]
+        values[:, len(keep) :] = aggregate_countries(
+            values[:, : len(keep)], membership
+        )
+    return days, countries + list(aggregates), extended
+
+
+def read_feed_table(file_path, columns, dtype):
+    """Reads the country names (column 2, the index) and the columns
+    (days) of the feed file file_path with the values in dtype
+    """
+    return pd.read_csv(
+        file_path,
+        header=None,
+        skiprows=1,
+        usecols=[1, *columns],
+        index_col=0,
+        dtype={column: dtype for column in columns},
+    )
 
+
+@tracing.traced
+def read_feeds(date, name_to_iso3, start=None):
+    """Reads the feed files (confirmed, deaths, recovered) of day date into
+    one array with the axes (category, day, country), including the derived
+    category active and the total of all countries (TTL, last country). If
+    start is provided only the days from start on are read. Returns the
+    days, the countries (sorted ISO3-codes), and the array.
+    """
     categories = get_categories()
-    prepped_data = {}
+    feeds = []
     for category in categories[:-1]:
+        # Selecting the columns: The country names (column 2) and the days
+        # (from column 5 on), i.e. province/state name and longitudes/
+        # latitudes aren't read at all
+        file_path = get_feed_file_path(date, category)
+        with file_path.open("r", newline="") as file:
+            header = next(csv.reader(file))
+        days = pd.to_datetime(header[4:], format="%m/%d/%y")
+        first = 0 if start is None else int(days.searchsorted(start))
+
+        # Reading the csv-feed-file into an array (rows x days), the country
+        # names serve as index. The counts are parsed as 32-bit integers (as
+        # the US feeds), only feeds with missing or non-integer values as
+        # 64-bit floats.
+        columns = range(4 + first, len(header))
+        with tracing.span("read_csv", category=category):
+            try:
+                df = read_feed_table(file_path, columns, "int32")
+            except (ValueError, OverflowError):
+                df = read_feed_table(file_path, columns, "float64")
+        tracing.count("rows parsed", len(df))
+        names = df.index.to_series()
+        iso3 = names.map(name_to_iso3)
+        if iso3.isna().any():
+            raise KeyError(f"Unknown countries: {list(names[iso3.isna()])}")
+        feeds.append((days[first:], iso3.to_numpy(), df.to_numpy()))
+        del df
+    days = feeds[0][0]
+    if any(not feed_days.equals(days) for feed_days, _, _ in feeds):
+        raise ValueError("The days of the feeds don't match")
+    countries = sorted(set().union(*(set(iso3) for _, iso3, _ in feeds)))
+
+    # The array for all categories, days and countries (plus TTL)
+    cube = np.empty((len(categories), len(days), len(countries) + 1))
+    for i in range(len(feeds)):
+        # Releasing each feed as soon as its values are in the array
+        _, iso3, values = feeds[i]
+        feeds[i] = None
+
+        # Aggregate (sum) over rows which belong to the same country: Adding
+        # up the rows unbuffered into the rows of their countries, i.e. the
+        # (integer) values are converted row by row and not as a whole.
+        # Missing values count as 0 (as in a groupby-sum), countries that
+        # aren't part of the feed don't have data.
+        if values.dtype.kind == "f":
+            values = np.nan_to_num(values, copy=False)
+        columns = np.searchsorted(countries, iso3)
+        table = np.zeros((len(countries), len(days)))
+        np.add.at(table, columns, values)
+        del values
+        missing = np.ones(len(countries), dtype="bool")
+        missing[columns] = False
+        table[missing] = np.nan
+
+        # Transposing the table (thereby producing real time series) and
+        # adding the total sum of all countries
+        cube[i, :, :-1] = table.T
+        cube[i, :, -1] = np.nansum(table, axis=0)
+
+    # Adding the cumulated data of active cases (in place)
+    np.subtract(cube[0], cube[2], out=cube[-1])
+    cube[-1] -= cube[1]
+
+    # Adding the US states (before the total, which doesn't include them)
+    us_data = read_us_feeds(date, start=start)
+    if us_data is not None:
+        us_days, states, us_cube = us_data
+        if not us_days.equals(days):
+            raise ValueError("The days of the US feeds don't match")
+        cube = np.concatenate([cube[..., :-1], us_cube, cube[..., -1:]], -1)
+        countries += states
+
+    return days, countries + ["TTL"], cube
+
+
+def get_us_county_states(date):
+    """Provides the join of the rows of the US feeds with their states via
+    the lookup table of day date: The sorted UIDs of the US rows (counties,
+    unassigned cases, territories) and the indices of their states in the
+    list of the US states (see basics.get_us_states)
+    """
+    # Columns: 0 = UID, 6 = province/state name, 7 = country name
+    lookup = pd.read_csv(
+        get_feed_file_path(date, "base"),
+        usecols=[0, 6, 7],
+        dtype={"UID": "int64"},
+    )
+    state_index = {state: k for k, state in enumerate(get_us_states())}
+    lookup = lookup[
+        (lookup.iloc[:, 2] == "US") & lookup.iloc[:, 1].isin(state_index)
+    ].sort_values("UID")
+    return (
+        lookup["UID"].to_numpy(),
+        lookup.iloc[:, 1].map(state_index).to_numpy(),
+    )
 
-        # Reading the csv-feed-file into a DataFrame
-        df = pd.read_csv(get_feed_file_path(date, category))
 
-        # Aggregate (sum) over rows which belong to the same country (names in
-        # column 2), which also makes the country names the new index
-        df = df.groupby(df.columns[1]).sum()
+def sum_us_rows(
+    file_path, columns, uids, state_indices, count, dtype, chunk_size
+):
+    """Reads the columns (days) of the US feed file file_path with the values
+    in dtype, in chunks of chunk_size rows, and sums them up per state (see
+    get_us_county_states, count states). Rows that don't belong to a state
+    (e.g. cruise ships) are dropped, missing values count as 0. Returns the
+    table (state x day).
+    """
+    table = np.zeros(
+        (count, len(columns)), dtype="int64" if dtype == "int32" else dtype
+    )
+    chunks = pd.read_csv(
+        file_path,
+        header=None,
+        skiprows=1,
+        usecols=[0, *columns],
+        dtype={0: "int64", **{column: dtype for column in columns}},
+        chunksize=chunk_size,
+    )
+    for chunk in chunks:
+        tracing.count("rows parsed", len(chunk))
+        positions = np.searchsorted(uids, chunk[0].to_numpy())
+        positions = np.minimum(positions, len(uids) - 1)
+        known = uids[positions] == chunk[0].to_numpy()
+        rows = state_indices[positions[known]]
+        values = chunk.iloc[:, 1:].to_numpy()[known]
+        if values.dtype.kind == "f":
+            values = np.nan_to_num(values, copy=False)
+        order = np.argsort(rows, kind="stable")
+        present, starts = np.unique(rows[order], return_index=True)
+        if len(present) > 0:
+            table[present] += np.add.reduceat(values[order], starts, axis=0)
+    return table
+
+
+@tracing.traced
+def read_us_feeds(date, start=None, chunk_size=1000):
+    """Reads the US county-level feeds (confirmed_us, deaths_us) of day date
+    and aggregates them per state: Returns the days, the states (see
+    basics.get_us_states), and the array with the axes (category, day,
+    state), or None if the US feeds aren't available. The US feeds don't
+    contain recovered cases, so recovered and active cases are NaN. If start
+    is provided only the days from start on are read.
+    Only the UID- and the day-columns are read, as 32-bit integers (see
+    sum_us_rows), and in chunks of chunk_size rows, which are summed up per
+    state right away.
+    """
+    file_paths = [
+        get_feed_file_path(date, category)
+        for category in ("confirmed_us", "deaths_us")
+    ]
+    if not all(file_path.exists() for file_path in file_paths):
+        return None
+
+    states = list(get_us_states().values())
+    uids, state_indices = get_us_county_states(date)
+    tables = []
+    for file_path in file_paths:
+        # The days start after the combined key (and the population size,
+        # which only the deaths feed contains)
+        with file_path.open("r", newline="") as file:
+            header = next(csv.reader(file))
+        first_column = header.index("Combined_Key") + 1
+        if "Population" in header:
+            first_column = header.index("Population") + 1
+        days = pd.to_datetime(header[first_column:], format="%m/%d/%y")
+        first = 0 if start is None else int(days.searchsorted(start))
+        columns = range(first_column + first, len(header))
+
+        # Summing up the rows of each state chunk by chunk (as 64-bit floats
+        # only if the feed has missing or non-integer values)
+        args = file_path, columns, uids, state_indices, len(states)
+        try:
+            table = sum_us_rows(*args, "int32", chunk_size)
+        except (ValueError, OverflowError):
+            table = sum_us_rows(*args, "float64", chunk_size)
+        tables.append((days[first:], table))
+
+    days = tables[0][0]
+    if not tables[1][0].equals(days):
+        raise ValueError("The days of the US feeds don't match")
+    cube = np.full((len(get_categories()), len(days), len(states)), np.nan)
+    cube[0] = tables[0][1].T
+    cube[1] = tables[1][1].T
+
+    return days, states, cube
+
+
+def get_first_day_column(header):
+    """Provides the index of the first day column (m/d/yy) of the header of
+    a feed file (the length of the header if there's none)
+    """
+    for k, column in enumerate(header):
+        try:
+            dt.datetime.strptime(column, "%m/%d/%y")
+        except ValueError:
+            continue
+        return k
+    return len(header)
+
+
+@tracing.traced
+def get_first_changed_day(date, prev_date, category):
+    """Compares the feed file of category from day date with the one from day
+    prev_date and returns the first day which is new or has been revised.
+    Returns None if the feeds can't be compared (missing file, different
+    rows or metadata, see get_first_day_column).
+    The comparison is done on the raw lines: If the history hasn't been
+    revised then every line of the older file is the beginning of the
+    respective line of the newer file. Only lines that differ are actually
+    split into their values.
+    """
+    prev_file_path = get_feed_file_path(prev_date, category)
+    if not prev_file_path.exists():
+        return None
+    with prev_file_path.open("r", newline="") as file:
+        prev_lines = file.read().splitlines()
+    with get_feed_file_path(date, category).open("r", newline="") as file:
+        lines = file.read().splitlines()
+    if len(lines) != len(prev_lines):
+        return None
+
+    # Header: The days of the older feed have to be the first days of the
+    # newer one
+    header = next(csv.reader(lines[:1]))
+    prev_header = next(csv.reader(prev_lines[:1]))
+    if header[:len(prev_header)] != prev_header:
+        return None
+
+    # Rows: Determining the first column that differs. The columns before
+    # the first day (names, coordinates, and in the US feeds the keys and
+    # the population size) have to be the same, otherwise the rows aren't
+    # comparable.
+    meta = get_first_day_column(prev_header)
+    first = len(prev_header)
+    for line, prev_line in zip(lines[1:], prev_lines[1:]):
+        rest = line[len(prev_line):]
+        if line.startswith(prev_line) and (rest == "" or rest[0] == ","):
+            continue
+        row, prev_row = next(csv.reader([line])), next(csv.reader([prev_line]))
+        if row[:meta] != prev_row[:meta]:
+            return None
+        first = min(
+            [first]
+            + [k for k in range(meta, len(prev_row)) if row[k] != prev_row[k]]
+        )
 
-        # Dropping the unnecessary columns (longitudes and latitudes -> 1, 2)
-        df = df.drop(columns=[df.columns[i] for i in {0, 1}])
+    if first == len(header):
+        return pd.Timestamp.max
+    return pd.to_datetime(header[first], format="%m/%d/%y")
 
-        # Setting a new index: ISO3-codes of the countries
-        df.index = pd.Index([name_to_iso3[name] for name in df.index])
 
-        # Transposing the DataFrame and thereby producing real time series
-        df = df.T
+@tracing.traced
+def read_feeds_incrementally(date, prev_date, name_to_iso3):
+    """Reads the feeds of day date by extending the cumulated data prepared
+    for day prev_date: Only the days which are new or have been revised
+    since then are read from the feed files (see get_first_changed_day).
+    Returns None if that isn't possible, i.e. a full preparation is needed.
+    """
+    materialize_date(prev_date)
+    starts = []
+    for category in get_feed_categories()[1:]:
+        if not get_feed_file_path(date, category).exists():
+            continue
+        start = get_first_changed_day(date, prev_date, category)
+        if start is None:
+            print_log(f"Feed {category} not comparable: Full preparation")
+            return None
+        starts.append(start)
+    start = min(starts)
+
+    # The region aggregates are left out: They are computed anew (see
+    # add_region_aggregates)
+    header, prev_cube = open_cube(prev_date)
+    prev_days = pd.DatetimeIndex(header["dates"])
+    keep = [
+        j for j, country in enumerate(header["countries"])
+        if not is_aggregate(country)
+    ]
+    prev_countries = [header["countries"][j] for j in keep]
+    prev_cube = to_floats(prev_cube[:, 0])[..., keep]
+    if start <= prev_days[-1]:
+        print_log(f"Feeds revised from {start.date()} on")
+
+    # Without new or revised days the cumulated data are complete
+    if start == pd.Timestamp.max:
+        print_log(f"Incremental preparation based on {prev_date}")
+        return prev_days, prev_countries, prev_cube
+
+    days, countries, cube = read_feeds(date, name_to_iso3, start=start)
+    if countries != prev_countries:
+        print_log("Countries changed: Full preparation")
+        return None
+    k = int(prev_days.searchsorted(start))
+    print_log(f"Incremental preparation based on {prev_date}")
+
+    return (
+        prev_days[:k].append(days),
+        countries,
+        np.concatenate([prev_cube[:, :k], cube], axis=1),
+    )
 
-        # Fixing index: Setting a new index with proper date-times
-        df.index = pd.Index(pd.to_datetime(df.index))
 
-        # Fixing columns: Adding a column for the total sum of all countries
-        df = (pd.concat([df, df.sum(axis="columns")], axis="columns")
-              .rename({0: "TTL"}, axis="columns"))
+@tracing.traced
+def get_feed_hashes(date):
+    """Provides the SHA-256 hashes of the feed files of day date, and of
+    the definition of the region aggregates (regions, see
+    basics.get_region_aggregates): The prepared data depend on both, i.e.
+    changed regions invalidate the prepared data (see is_prepared) as
+    changed feeds do.
+    """
+    feed_hashes = {
+        category: get_file_hash(get_feed_file_path(date, category))
+        for category in get_feed_categories()
+        if get_feed_file_path(date, category).exists()
+    }
+    feed_hashes["regions"] = hashlib.sha256(
+        json.dumps(get_region_aggregates(), sort_keys=True).encode()
+    ).hexdigest()
+    return feed_hashes
 
-        # Packing the frame in the dictionary for the prepped data
-        prepped_data[category] = {"cum": df.copy()}
 
-    # Adding the table of cumulated data of active cases to the dictionary
-    prepped_data["active"] = {}
-    prepped_data["active"]["cum"] = (
-        prepped_data["confirmed"]["cum"]
-        - prepped_data["recovered"]["cum"]
-        - prepped_data["deaths"]["cum"]
+def is_prepared(date, feed_hashes, compact=False):
+    """Checks if the data of day date have been prepared (with compact)
+    from feed files with the hashes feed_hashes (see storing.write_cube)
+    """
+    if not cube_exists(date):
+        return False
+    header = load_cube_header(date)
+    return (
+        header.get("sha256") == feed_hashes
+        and header.get("compact", False) == compact
     )
 
-    # Creating the rest of the dependent data (rel, diffs, ma, ...)
-    popn = get_base_data(date, columns=("iso3", "pop"))
-    for category in categories:
-        pmio = [
-            popn[country] / 1e6
-            for country in prepped_data[category]["cum"].columns
-        ]
-        p100k = [
-            popn[country] / 1e5
-            for country in prepped_data[category]["cum"].columns
-        ]
-        prepped_data[category]["cum_rel_popmio"] = \
-            prepped_data[category]["cum"].div(pmio)
-        prepped_data[category]["cum_rel_pop100k"] = \
-            prepped_data[category]["cum"].div(p100k)
-        prepped_data[category]["diff"] = prepped_data[category]["cum"].diff()
-        prepped_data[category]["diff_rel_popmio"] = \
-            prepped_data[category]["cum_rel_popmio"].diff()
-        prepped_data[category]["diff_rel_pop100k"] = \
-            prepped_data[category]["cum_rel_pop100k"].diff()
-        prepped_data[category]["diff_ma1w"] = \
-            prepped_data[category]["diff"].rolling(7).mean()
-        prepped_data[category]["diff_rel_popmio_ma1w"] = \
-            prepped_data[category]["diff_rel_popmio"].rolling(7).mean()
-        prepped_data[category]["diff_rel_pop100k_ma1w"] = \
-            prepped_data[category]["diff_rel_pop100k"].rolling(7).mean()
-        if category == "active":
-            prepped_data[category]["diff_rel_active"] = (
-                prepped_data[category]["diff"]
-                .div(prepped_data[category]["cum"].shift(periods=1))
+
+@tracing.traced
+def reuse_prepared_data(source_date, date):
+    """Makes the prepared data of day source_date available for day date (by
+    linking the files). Returns False if there aren't any prepared data for
+    source_date.
+    """
+    if not cube_exists(source_date):
+        return False
+
+    # The files of an archived day are restored before they are linked
+    if source_date != date:
+        materialize_date(source_date)
+        target_dir_path = get_dir_path("data", date)
+        for file_path in get_dir_path("data", source_date).iterdir():
+            if file_path.is_file():
+                link_file(file_path, target_dir_path / file_path.name)
+
+    return True
+
+
+@tracing.traced
+def prepare_data(
+    date,
+    excel_output=False,
+    force=False,
+    incremental=False,
+    compact=False,
+    record_state=True,
+):
+    """Actual data preparation (see the comments for details). The
+    preparation is skipped (unless force=True) if the data of day date have
+    already been prepared from feeds with the same content, or if the feeds
+    of day date have the same content as the feeds of the last preparation:
+    Its prepared data are reused instead. With incremental=True the data
+    prepared for the latest day before date are extended by the new (or
+    revised) days only. With compact=True the data are stored and loaded in
+    compact data types (see storing.write_cube). With record_state=False the
+    preparation isn't recorded as the last one in the state manifest (e.g.
+    when preparing older days, see backfill_data).
+    """
+    materialize_date(date)
+    feed_hashes = get_feed_hashes(date)
+    if (
+        not force
+        and not excel_output
+        and is_prepared(date, feed_hashes, compact)
+    ):
+        print_log(f"Data of {date} already prepared")
+        return
+
+    state = get_state()
+    prepared = state["prepared"]
+    if (
+        not force
+        and not excel_output
+        and prepared.get("sha256") == feed_hashes
+        and prepared.get("compact", False) == compact
+        and prepared["date"] != date
+        and reuse_prepared_data(prepared["date"], date)
+    ):
+        print_log(
+            f"Feeds unchanged: Reusing prepared data from {prepared['date']}"
+        )
+        return
+
+    print_log("Preparing data ...")
+
+    # Preparing the base data (name, keys, pop-numbers)
+    prepare_base_data(date)
+
+    # Getting a dictionary that translates country names in iso3-code
+    name_to_iso3 = get_base_data(date, columns=("name", "iso3"))
+
+    categories = get_categories()
+
+    # Incremental mode: Reading only the days that are new or have been
+    # revised since the last preparation (see read_feeds_incrementally)
+    cum_data = None
+    if incremental:
+        prepared_dates = [day for day in get_prepared_dates() if day < date]
+        if prepared_dates:
+            cum_data = read_feeds_incrementally(
+                date, prepared_dates[-1], name_to_iso3
             )
-    
+
+    # Full mode: Reading the complete feeds
+    if cum_data is None:
+        cum_data = read_feeds(date, name_to_iso3)
+
+    # Adding the region aggregates (see add_region_aggregates), their
+    # population sizes are part of the base data
+    cum_data = add_region_aggregates(*cum_data)
+    population = get_base_data(date, columns=("iso3", "pop"))
+
+    # Writing the cumulated data and the population sizes into the cube file
+    # (see storing.write_cube): All other variants (rel, diffs, ma, ...) are
+    # derived on demand from them (see storing.DataStore)
+    print_log("Writing cube file ...")
+    write_cube(
+        date,
+        categories,
+        *cum_data,
+        population,
+        compact=compact,
+        feed_hashes=feed_hashes,
+    )
+    print_log("Cube file finished")
+
     # If asked for (keyword argument excel_output=True): Writing the data
     # organised by tables which respectively contain all countries sheet-wise
     # into one large Excel-file
     if excel_output:
         print_log("Writing Excel-file ...")
+        store = DataStore(date)
         xlsx_file_path = str(get_data_file_path(date, file_format="xlsx"))
         with pd.ExcelWriter(xlsx_file_path) as xlsx_file:
             for category, variant in [
                 (category, variant)
                 for category in categories
-                for variant in prepped_data[category]
+                for variant in get_variants(category)
             ]:
-                df = prepped_data[category][variant]
-                df.to_excel(xlsx_file, sheet_name=f"{category}_{variant}")
+                # Sheet names are limited to 31 characters: The windowed
+                # variants don't fit with rel_ (e.g. diff_pop100k_ema4w)
+                df = store.get(category, variant)
+                sheet_name = f"{category}_{variant.replace('_rel_', '_')}"
+                df.to_excel(xlsx_file, sheet_name=sheet_name)
         print_log("Excel-file finished")
 
-    # Writing the data in one JSON-file: Organized with a multi-index
-    # (category, variant, day) and the countries as columns
-
-    # Stacking the individual frames in order category -> variant after
-    # adjusting the index
-    df_all = pd.DataFrame()
-    for category, variant in [
-        (category, variant)
-        for category in categories
-        for variant in prepped_data[category]
-    ]:
-        df = prepped_data[category][variant]
-        df.index = pd.MultiIndex.from_tuples(
-            zip(
-                [category] * len(df.index),
-                [variant] * len(df.index),
-                list(df.index),
-            )
-        )
-        df_all = pd.concat([df_all, df])
+    # Recording the preparation in the state manifest
+    if record_state:
+        state["prepared"] = {
+            "date": date, "sha256": feed_hashes, "compact": compact
+        }
+        save_state(state)
 
-    # Giving the new index names, and the columns as well
-    df_all.index.names = ["category", "variant", "date"]
-    df_all.columns.name = "country"
+    print_log("Data preparation finished")
 
-    # Sorting for better query performance
-    df_all.sort_index()
 
-    # Writing the new frame in a JSON-file
-    print_log("Writing JSON-file ...")
-    json_file_path = get_data_file_path(date, file_format="json.gz")
-    df_all.to_json(
-        json_file_path, orient="table", indent=4, compression="gzip"
-    )
-    print_log("JSON-file finished")
+def init_worker(settings, tracing_enabled):
+    """Initializes a worker process of the backfill pool: The settings of
+    the parent process are taken over, as well as tracing, if enabled (with
+    a new trace)
+    """
+    use_settings(settings)
+    if tracing_enabled:
+        tracing.enable_tracing(reset=True)
 
-    print_log("Data preparation finished")
+
+def backfill_date(date, compact=False, force=False):
+    """Prepares the data of day date for backfill_data. Returns the duration
+    of the preparation (in seconds).
+    """
+    start = perf_counter()
+    prepare_data(date, force=force, compact=compact, record_state=False)
+    return perf_counter() - start
+
+
+@tracing.traced
+def backfill_data(dates=None, jobs=1, compact=False, force=False):
+    """Prepares the data of the days dates (default: all days with a data
+    directory, archived days are restored if they are requested, see
+    archiving) in parallel by a pool of jobs worker processes. Days whose
+    data have already been prepared from feeds with the same content are
+    skipped (unless force=True). Every day is prepared completely (not
+    incrementally, the days are independent of each other), and not
+    recorded as the last preparation (see prepare_data).
+    """
+    if dates is None:
+        dates = get_materialized_dates()
+    pending = []
+    for date in dict.fromkeys(dates):
+        materialize_date(date)
+        if not get_feed_file_path(date, "base").exists():
+            print_log(f"No feeds for {date}: Skipped")
+            continue
+        if force or not is_prepared(date, get_feed_hashes(date), compact):
+            pending.append(date)
+    dates = pending
+    print_log(f"Backfilling {len(dates)} days ...")
+    start = perf_counter()
+
+    # Retrieving the results re-raises any exception of a worker
+    if jobs <= 1 or len(dates) <= 1:
+        durations = [backfill_date(date, compact, force) for date in dates]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=init_worker,
+            initargs=(get_settings(), tracing.is_tracing()),
+        ) as executor:
+            task = partial(backfill_date, compact=compact, force=force)
+            if tracing.is_tracing():
+                futures = [
+                    executor.submit(tracing.call_traced, task, (date,))
+                    for date in dates
+                ]
+                durations = [
+                    tracing.merge_traced(future.result())
+                    for future in futures
+                ]
+            else:
+                futures = [executor.submit(task, date) for date in dates]
+                durations = [future.result() for future in futures]
+
+    print_log(
+        f"Backfilling finished: {len(dates)} days in "
+        f"{perf_counter() - start:.1f} s "
+        f"({sum(durations):.1f} s of preparation)"
+    )
@@ -0,0 +1,315 @@
+from collections import OrderedDict
+from functools import partial
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import shutil
+import threading
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from matplotlib import pyplot as plt
+
+from utils import tracing
+from utils.basics import *
+from utils.showing import get_render_profile, show_countries, show_groups
+from utils.storing import (
+    cube_exists,
+    get_cube_state,
+    get_prepared_dates,
+    get_store,
+)
+
+
+# Serving: A long-running local HTTP server which renders the plots of
+# countries and groups on request. The prepared data (data stores, see
+# storing.get_store), the figure templates, and the rendered plots are kept
+# in memory between the requests, so only the first request for a plot pays
+# for loading and rendering. Requests:
+# - /dates: The days with prepared data (JSON)
+# - /DATE/countries/COUNTRY[/CATEGORY[/VARIANT]]: A plot file of the country
+#   (see show_countries), e.g. /latest/countries/DEU/confirmed/diff
+# - /DATE/groups/COUNTRY-COUNTRY-...[/CATEGORY[/VARIANT]]: A plot file of the
+#   group of the countries (see show_groups)
+# DATE is a day (yy-mm-dd) or latest, the last day with prepared data, which
+# is looked up with every request: Newly prepared days are served without a
+# restart. Without category the file with all plots is returned, without
+# variant the file of the category. The query parameters length (number of
+# days) and profile (render profile) override the defaults of the server.
+# The server renders into its own folders (see get_serve_folder): The plot
+# files of the runs (output_path/plots/dte) aren't touched. The files are
+# only needed until they are read into memory, they are removed with their
+# plots (see remove_plot_files and remove_served_date), and when the server
+# starts or stops.
+
+# Content types of the plot file formats
+content_types = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "svg": "image/svg+xml",
+}
+
+# Rendered plots: (date, cube state, kind, base, length, profile) -> (file
+# name -> content), the least recently used are dropped first if they exceed
+# max_plot_bytes. A cube prepared again (see storing.get_cube_state) makes
+# the plots of its day outdated: They are dropped when a plot of the new
+# cube state is requested (served_states: date -> cube state).
+plots = OrderedDict()
+max_plot_bytes = 256 * 2**20
+served_states = {}
+
+# Rendering (matplotlib, data stores) isn't thread-safe: Only one request at
+# a time renders, the others are served from the rendered plots meanwhile
+render_lock = threading.Lock()
+plots_lock = threading.Lock()
+
+
+def resolve_date(date):
+    """Provides the day date (latest: the last day with prepared data), or
+    raises LookupError if there are no prepared data for it (ValueError if
+    it isn't a day)
+    """
+    if date == "latest":
+        dates = get_prepared_dates()
+        if not dates:
+            raise LookupError("No prepared data available")
+        return dates[-1]
+    dt.datetime.strptime(date, "%y-%m-%d")
+    if not cube_exists(date):
+        raise LookupError(f"No prepared data for {date}")
+    return date
+
+
+def get_serve_folder(date, length):
+    """Provides the folder the server renders the plots of day date with
+    length days into: output_path/plots/serve/dte/length
+    """
+    return get_dir_path("base_plots") / "serve" / date / str(length)
+
+
+def get_plot_folder(key):
+    """Provides the folder of the plot files of key (see plots)"""
+    date, _, _, base, length, profile_name = key
+    return get_plot_file_path(
+        date, base, profile=profile_name, folder=get_serve_folder(date, length)
+    ).parent
+
+
+def remove_plot_files(key):
+    """Removes the plot files of key (see plots), but not the folders of the
+    other render profiles inside its folder
+    """
+    folder = get_plot_folder(key)
+    if not folder.is_dir():
+        return
+    for file_path in folder.iterdir():
+        if file_path.is_file():
+            file_path.unlink()
+
+
+def remove_served_date(date, state):
+    """Drops the rendered plots of day date which aren't of the cube state
+    state, and removes the plot files of the day
+    """
+    with plots_lock:
+        for key in [key for key in plots if key[0] == date]:
+            if key[1] != state:
+                del plots[key]
+    folder = get_dir_path("base_plots") / "serve" / date
+    shutil.rmtree(folder, ignore_errors=True)
+    get_settings().paths.forget_dir(folder)
+
+
+def remove_serve_folder():
+    """Removes all plot files of the server (e.g. of an earlier run), and
+    the figures of the plot cache which are no longer linked
+    """
+    folder = get_dir_path("base_plots") / "serve"
+    shutil.rmtree(folder, ignore_errors=True)
+    get_settings().paths.forget_dir(folder)
+    prune_plot_cache()
+
+
+def get_cached_plots(key):
+    """Provides the rendered plots of key (see plots), or None"""
+    with plots_lock:
+        if key not in plots:
+            return None
+        plots.move_to_end(key)
+        return plots[key]
+
+
+def cache_plots(key, files):
+    """Keeps the rendered plots files (file name -> content) of key (see
+    plots) and drops the least recently used ones beyond max_plot_bytes,
+    together with their plot files (see remove_plot_files)
+    """
+    dropped_keys = []
+    with plots_lock:
+        plots[key] = files
+        size = sum(
+            len(content) for files in plots.values()
+            for content in files.values()
+        )
+        while size > max_plot_bytes and len(plots) > 1:
+            dropped_key, dropped = plots.popitem(last=False)
+            size -= sum(len(content) for content in dropped.values())
+            dropped_keys.append(dropped_key)
+    for dropped_key in dropped_keys:
+        remove_plot_files(dropped_key)
+
+
+def get_plots(date, kind, countries, length, profile):
+    """Provides the plot files (file name -> content) of the country (kind
+    countries) or the group of the countries (kind groups) for day date,
+    with the last length days and the render profile: From memory, or
+    rendered (see show_countries and show_groups) and then kept in memory
+    """
+    base = countries[0] if kind == "countries" else " vs. ".join(countries)
+    key = date, get_cube_state(date), kind, base, length, profile["name"]
+    files = get_cached_plots(key)
+    if files is not None:
+        tracing.count("plots served from memory")
+        return base, files
+
+    with render_lock:
+        # Another request might have rendered the plots meanwhile
+        files = get_cached_plots(key)
+        if files is not None:
+            return base, files
+
+        # A new cube state of the day outdates its rendered plots
+        state = key[1]
+        if served_states.setdefault(date, state) != state:
+            remove_served_date(date, state)
+            served_states[date] = state
+            prune_plot_cache()
+
+        missing = [
+            country for country in countries
+            if country not in get_store(date).country_index
+        ]
+        if missing:
+            raise LookupError(f"Unknown countries {str.join(', ', missing)}")
+        folder = get_serve_folder(date, length)
+        if kind == "countries":
+            show_countries(
+                date,
+                base,
+                length=length,
+                profile=profile["name"],
+                folder=folder,
+            )
+        else:
+            show_groups(
+                date,
+                {base: countries},
+                length=length,
+                profile=profile["name"],
+                folder=folder,
+            )
+
+        # The plot files of the request are read right after rendering
+        file_format = profile["format"]
+        folder = get_plot_file_path(
+            date,
+            base,
+            file_format=file_format,
+            profile=profile["name"],
+            folder=folder,
+        ).parent
+        files = {
+            file_path.name: file_path.read_bytes()
+            for file_path in folder.glob(f"*.{file_format}")
+        }
+
+        # Dropping plots (and removing their files) only while no other
+        # request renders
+        cache_plots(key, files)
+    return base, files
+
+
+class PlotRequestHandler(BaseHTTPRequestHandler):
+    """Handles the requests of the plot server (see serve): length and
+    profile are the defaults of the plots
+    """
+
+    def __init__(self, *args, length=365, profile="default", **kwargs):
+        self.length = length
+        self.profile = profile
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.split("/") if part]
+        query = parse_qs(url.query)
+        try:
+            if parts == ["dates"]:
+                self.send_content(
+                    json.dumps(get_prepared_dates()).encode(),
+                    "application/json",
+                )
+                return
+            if not (
+                3 <= len(parts) <= 5 and parts[1] in ("countries", "groups")
+            ):
+                raise LookupError(f"Unknown request {url.path}")
+            date, kind, name, *figure = parts
+            date = resolve_date(date)
+            length = int(query.get("length", [self.length])[0])
+            profile = get_render_profile(
+                query.get("profile", [self.profile])[0]
+            )
+            countries = [name] if kind == "countries" else name.split("-")
+            with tracing.span("serve", kind=kind, plots=name):
+                base, files = get_plots(date, kind, countries, length, profile)
+            file_name = str.join("_", [base] + figure)
+            file_name += "." + profile["format"]
+            if file_name not in files:
+                raise LookupError(
+                    f"Plot {file_name} not available (profile "
+                    f"{profile['name']})"
+                )
+            self.send_content(
+                files[file_name], content_types[profile["format"]]
+            )
+        except LookupError as error:
+            self.send_error(HTTPStatus.NOT_FOUND, str(error))
+        except ValueError as error:
+            self.send_error(HTTPStatus.BAD_REQUEST, str(error))
+
+    def send_content(self, content, content_type):
+        """Sends the response with the content (bytes) of content_type"""
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        print_log(f"{self.address_string()} {format % args}")
+
+
+def serve(port=8000, host="127.0.0.1", length=365, profile="default"):
+    """Serves the plots of countries and groups (see the requests above) via
+    HTTP on host:port until the process is interrupted (Ctrl-C): length is
+    the default number of days of the plots, profile the default render
+    profile (see showing.get_render_profiles)
+    """
+    # The plots are only saved into files, which are removed when they
+    # aren't needed anymore
+    plt.switch_backend("Agg")
+    get_render_profile(profile)
+    remove_serve_folder()
+
+    server = ThreadingHTTPServer(
+        (host, port),
+        partial(PlotRequestHandler, length=length, profile=profile),
+    )
+    print_log(f"Serving plots on http://{host}:{server.server_port}/ ...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        remove_serve_folder()
+    print_log("Serving finished")
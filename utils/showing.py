@@ -1,102 +1,528 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+from pathlib import Path
+from time import perf_counter
+
+import matplotlib
 import numpy as np
 import pandas as pd
 from matplotlib import pyplot as plt
+from matplotlib.collections import LineCollection
 
+from utils import tracing
 from utils.basics import *
 from utils.prepping import get_base_data
+from utils.storing import (
+    align_beyond_threshold,
+    cube_exists,
+    get_revisions,
+    get_store,
+    load_series,
+    load_vintages,
+    parse_window_variant,
+)
 
 
 # Showing the data
 
 
-def get_country_data_to_show(date, plots, *countries, length=1000):
-    """Returns the data from day date for the categories and variants defined
-    in the dictionary plots and the countries, all loaded in one dictionary
+def get_window_title(trsl, variant):
+    """Composes the title of the windowed variant (see
+    storing.parse_window_variant) from the titles of its parts, e.g.
+    diff_sum2w -> 2-Week Mov. Sum of $\\Delta(t,\\, t-1)$
     """
-    file_path = get_data_file_path(date, file_format="json.gz")
-    if not file_path.exists():
-        print("Data not available, please download first.")
-        return False
-    
-    tbl = pd.read_json(
-        file_path,
-        orient="table",
-        compression="gzip",
-    ).sort_index()
-
-    data = dict()
-    for country in countries:
-        data[country] = {category: {} for category in plots}
-    for category, variant, country in [
-        (category, variant, country)
-        for category in plots
-        for variant in plots[category]
-        for country in countries
-    ]:
-        data[country][category][variant] = tbl.loc[
-            (category, variant), country
-        ].tail(length)
-
-    return data
-
-
-def get_title_translation():
+    base, statistic, days = parse_window_variant(variant)
+    if statistic == "wow":
+        return f"{trsl['wow']} of {trsl[base]}"
+    if days % 7 == 0:
+        window = f"{days // 7}-{trsl['w']}"
+    else:
+        window = f"{days}-{trsl['d']}"
+    return f"{window} {trsl[statistic]} of {trsl[base]}"
+
+
+def get_title_translation(*variants):
     """Returns dictionary which translates shortcuts in text suitable for plot
-    titles
+    titles: The titles of the settings file title_translation.json, plus the
+    composed titles (see get_window_title) of the windowed variants of
+    basics.get_variants and of the additional variants which aren't in the
+    settings file
+    """
+    trsl = dict(get_settings().get("title_translation"))
+    for variant in get_variants("active") + list(variants):
+        if variant not in trsl and parse_window_variant(variant) is not None:
+            trsl[variant] = get_window_title(trsl, variant)
+    return trsl
+
+
+def get_render_profiles():
+    """Returns the dictionary of the render profiles (name -> profile) from
+    the settings file render_profiles.json. A profile defines
+    - figure_sizes: The sizes (in inches) of the figures of the tiers all
+      (all plots), category (the plots of a category), and single (one plot)
+    - font_scale: Factor for the font sizes, line widths, and marker sizes
+    - dpi: The resolution of raster formats
+    - format: The file format, png, webp, or svg
+    - tiers: The tiers of figures that are produced
     """
-    return json.load(get_settings_file_path("title_translation").open("r"))
+    return get_settings().get("render_profiles")
+
+
+def get_render_profile(name="default"):
+    """Returns the render profile name (see get_render_profiles), including
+    its name
+    """
+    profiles = get_render_profiles()
+    if name not in profiles:
+        raise ValueError(
+            f"Unknown render profile {name}, available profiles: "
+            f"{str.join(', ', profiles)}"
+        )
+    return dict(profiles[name], name=name)
 
 
-def setup_ax(ax, days):
-    """Set up the axes for the plots"""
+def get_tier(key):
+    """Provides the tier of the figure key (see FigureTemplates)"""
+    return ("all", "category", "single")[len(key)]
 
+
+def get_ticks(days):
+    """Provides the ticks (positions and labels) of the x-axis for the days:
+    - Minor ticks: Only 3 for each month, roughly the end of the 1., 2. and
+      3. week, labeled with the day, i.e. 8, 16 and 24
+    - Major ticks: Months end/beginning, labeled with the short version of
+      the months name
+    """
     # Months
     months = (
         "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct",
         "Nov", "Dec",
     )
 
-    # Setting the viewable range of x-axis
-    ax.set_xlim(-2, len(days) + 1)
+    days = pd.DatetimeIndex(days)
+    minor_ticks = np.flatnonzero(days.day.isin([8, 16, 24]))
+    minor_labels = list(days.day[minor_ticks])
 
-    # Setting the ticks (positions and labels) mostly on x-axis
+    # Detecting the beginnings of new months
+    month_numbers = days.month.to_numpy()
+    major_ticks = np.flatnonzero(month_numbers[1:] != month_numbers[:-1]) + 1
+    major_labels = [months[month - 1] for month in month_numbers[major_ticks]]
 
-    # Minor ticks: Only 3 for each month, roughly the end of the 1., 2. and 3.
-    # week
-    minor_ticks = [i for i in range(len(days)) if days[i].day in (8, 16, 24)]
+    return list(minor_ticks), minor_labels, list(major_ticks), major_labels
 
-    # Minor labels: Day of minor tick, i.e. 8, 16 and 24
-    minor_labels = [days[i].day for i in minor_ticks]
 
-    # Major: Ticks = months end/beginning, label: short version of months name
-    major_ticks = []
-    major_labels = []
-    month = days[0].month
-    for i, day in enumerate(days[1:], start=1):
-        # Detecting the beginning of a new month
-        if day.month != month:
-            major_ticks.append(i)
-            month = day.month
-            major_labels.append(months[month - 1])
+def setup_ax(ax, days, ticks=None, scale=1):
+    """Set up the axes for the plots: ticks are the ticks of the x-axis for
+    the days (see get_ticks), which are determined if not provided, scale is
+    the factor for the font sizes and line widths
+    """
+    # Setting the viewable range of x-axis
+    ax.set_xlim(-2, len(days) + 1)
 
-    # Actually setting the prepared ticks/labels, including the label size
+    # Actually setting the ticks/labels (mostly on x-axis), including the
+    # label size
+    if ticks is None:
+        ticks = get_ticks(days)
+    minor_ticks, minor_labels, major_ticks, major_labels = ticks
     ax.xaxis.set_ticks(minor_ticks, minor=True)
     ax.xaxis.set_ticklabels(minor_labels, minor=True)
     ax.xaxis.set_ticks(major_ticks, minor=False)
     ax.xaxis.set_ticklabels(major_labels, minor=False)
-    ax.xaxis.set_tick_params(which="both", labelsize=10)
-    ax.yaxis.set_tick_params(which="both", labelsize=12)
+    ax.xaxis.set_tick_params(which="both", labelsize=10 * scale)
+    ax.yaxis.set_tick_params(which="both", labelsize=12 * scale)
 
     # Setting the grid
     ax.grid(True, which="both")
-    ax.grid(which="major", linestyle="dashed", linewidth=2)
+    ax.grid(which="major", linestyle="dashed", linewidth=2 * scale)
     ax.grid(which="minor", linestyle="dashed")
 
     # Setting the labels of the x-axis, including the font size
-    ax.set_xlabel("day", fontsize=14)
+    ax.set_xlabel("day", fontsize=14 * scale)
+
+
+class FigureTemplates:
+    """Templates for the standard set of figures of show_countries and
+    show_groups: One figure with all plots (3 x 2), one figure per category
+    (2 plots), and one figure per plot (category and variant), as defined
+    by the dictionary plots. Only the figures of the tiers of the render
+    profile (see get_render_profiles) are created. The figures, including
+    their layout (axes, titles, ticks, grid), are created once for the days;
+    for every country or group only the titles and the data of the lines
+    are swapped in.
+    """
+
+    title_font_size = 30
+
+    # The style parameters which are scaled by the font scale of the profile
+    scaled_rc_params = (
+        "font.size", "lines.linewidth", "lines.markersize", "grid.linewidth",
+        "axes.linewidth", "axes.titlepad", "axes.labelpad",
+        "xtick.major.size", "xtick.minor.size", "xtick.major.width",
+        "xtick.minor.width", "xtick.major.pad", "xtick.minor.pad",
+        "ytick.major.size", "ytick.minor.size", "ytick.major.width",
+        "ytick.minor.width", "ytick.major.pad", "ytick.minor.pad",
+    )
+
+    def __init__(self, days, plots, trsl, profile):
+        self.days = days
+        self.x = np.arange(len(days))
+        self.trsl = trsl
+        self.profile = profile
+        scale = profile["font_scale"]
+        self.rc = {
+            param: matplotlib.rcParams[param] * scale
+            for param in self.scaled_rc_params
+        }
+        ticks = get_ticks(days)
+
+        # The figures (key: () for the figure with all plots, (category,)
+        # for the figures per category, (category, variant) for the single
+        # plots) and the axes (one per figure that contains the plot) with
+        # their lines
+        self.figures = {}
+        self.axes = {}
+        self.lines = {}
+        sizes = profile["figure_sizes"]
+        tiers = profile["tiers"]
+        with plt.rc_context(self.rc):
+            if "all" in tiers:
+                fig_all, axs_all = plt.subplots(3, 2, figsize=sizes["all"])
+                self.figures[()] = fig_all
+            for i, category in enumerate(plots):
+                if "category" in tiers:
+                    fig_cat, axs_cat = plt.subplots(
+                        2, 1, figsize=sizes["category"]
+                    )
+                    self.figures[category,] = fig_cat
+                for j, variant in enumerate(plots[category]):
+                    axes = []
+                    if "single" in tiers:
+                        fig, axs = plt.subplots(figsize=sizes["single"])
+                        self.figures[category, variant] = fig
+                        axes.append(axs)
+                    if "category" in tiers:
+                        axes.append(axs_cat[j])
+                    if "all" in tiers:
+                        axes.append(axs_all[i][j])
+                    self.axes[category, variant] = axes
+                    self.lines[category, variant] = [[] for _ in axes]
+                    for ax in axes:
+                        ax.set_title(
+                            f"{trsl[category]} - {trsl[variant]}",
+                            fontsize=20 * scale,
+                        )
+                        setup_ax(ax, days, ticks, scale)
+
+            self.titles = {}
+            for key, fig in self.figures.items():
+                self.titles[key] = fig.suptitle(
+                    "",
+                    fontsize=self.title_font_size * scale,
+                    fontweight="bold",
+                )
+                fig.align_labels()
+
+    def set_titles(self, name):
+        """Sets the titles of the figures for country/group name"""
+        for key, title in self.titles.items():
+            title.set_text(
+                " - ".join([name] + [self.trsl[part] for part in key])
+            )
+
+    def set_lines(
+        self, key, values, styles, labels=None, legend_kw=None, bottom=None
+    ):
+        """Swaps the data (values: list of arrays, one per line) into the
+        lines of plot key (category, variant) in all figures. The lines are
+        created with the format strings styles when needed, unused lines are
+        hidden. If labels (None for lines without label) are provided a
+        legend is added. The y-axis is rescaled, its minimum set to bottom
+        if provided.
+        """
+        with plt.rc_context(self.rc):
+            for ax, lines in zip(self.axes[key], self.lines[key]):
+                while len(lines) < len(values):
+                    lines.append(ax.plot([], [], styles[len(lines)])[0])
+                for k, line in enumerate(lines):
+                    line.set_visible(k < len(values))
+                    if k < len(values):
+                        line.set_data(self.x, values[k])
+
+                if labels is not None:
+                    ax.legend(
+                        [line for line, label in zip(lines, labels) if label],
+                        [label for label in labels if label],
+                        **(legend_kw or {}),
+                    )
+
+                ax.relim(visible_only=True)
+                ax.set_autoscaley_on(True)
+                ax.autoscale_view(scalex=False)
+                if bottom is not None:
+                    ax.set_ylim(bottom=bottom)
+
+    def save(self, date, base, key, folder=None):
+        """Saves the figure key into the plot file of day date for base (in
+        folder, see basics.get_plot_file_path), in the format and with the
+        resolution of the render profile. An existing file is removed first:
+        It might be a hard link to a file in the plot cache (see
+        save_plots). Returns the path of the file.
+        """
+        file_format = self.profile["format"]
+        file_path = get_plot_file_path(
+            date,
+            base,
+            *key,
+            file_format=file_format,
+            profile=self.profile["name"],
+            folder=folder,
+        )
+        file_path.unlink(missing_ok=True)
+        with tracing.span("savefig", figure=str.join("_", key)):
+            self.figures[key].savefig(
+                file_path, format=file_format, dpi=self.profile["dpi"]
+            )
+        tracing.count("figures rendered")
+        return file_path
+
 
+# Templates of the current process: kind -> (key, templates)
+templates = {}
 
-def show_countries(date, *countries, length=1000):
+
+def get_templates(kind, days, plots, trsl, profile):
+    """Provides the figure templates of kind (countries or groups) for the
+    days, plots, and render profile: They are reused as long as days, plots,
+    and profile don't change, otherwise the old templates are closed and
+    replaced
+    """
+    key = (
+        days[0],
+        len(days),
+        tuple((c, tuple(v)) for c, v in plots.items()),
+        json.dumps(profile, sort_keys=True),
+    )
+    if kind not in templates or templates[kind][0] != key:
+        if kind in templates:
+            for fig in templates[kind][1].figures.values():
+                plt.close(fig)
+        with tracing.span("create_templates", kind=kind):
+            templates[kind] = key, FigureTemplates(days, plots, trsl, profile)
+    return templates[kind][1]
+
+
+def init_worker(settings, tracing_enabled):
+    """Initializes a worker process of the rendering pool: The settings of
+    the parent process are taken over, as well as tracing, if enabled (with
+    a new trace), and, since figures are only saved into files, the
+    non-interactive backend is sufficient
+    """
+    use_settings(settings)
+    if tracing_enabled:
+        tracing.enable_tracing(reset=True)
+    plt.switch_backend("Agg")
+
+
+def render(function, tasks, jobs=1):
+    """Calls function with the argument tuples in tasks: Sequentially, or,
+    if jobs > 1, distributed over a pool of jobs worker processes (their
+    traces are merged into the trace of the current process if tracing is
+    enabled). Returns the list of the results.
+    """
+    if jobs <= 1 or len(tasks) <= 1:
+        return [function(*task) for task in tasks]
+
+    # Retrieving the results re-raises any exception of a worker
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=init_worker,
+        initargs=(get_settings(), tracing.is_tracing()),
+    ) as executor:
+        if not tracing.is_tracing():
+            futures = [executor.submit(function, *task) for task in tasks]
+            return [future.result() for future in futures]
+
+        futures = [
+            executor.submit(tracing.call_traced, function, task)
+            for task in tasks
+        ]
+        return [tracing.merge_traced(future.result()) for future in futures]
+
+
+def log_render_stats(name, results, start):
+    """Logs the statistics of the rendering with the render profile name:
+    results are the (rendered figures, bytes written) of the tasks, start is
+    the perf_counter value at the begin
+    """
+    rendered = sum(result[0] for result in results)
+    written = sum(result[1] for result in results)
+    print_log(
+        f"Profile {name}: {rendered} figures rendered, "
+        f"{written / 2**20:.1f} MB written, "
+        f"{perf_counter() - start:.2f} s"
+    )
+
+
+# Plot cache: Every rendered figure is also stored (as hard link) under the
+# hash of its content, i.e. the data and titles of its plots, the style of
+# the figures, and the code that renders them. A figure whose hash is
+# already in the cache doesn't have to be rendered again. Figures no plot
+# directory links to anymore are removed (see basics.prune_plot_cache).
+
+# Version of the rendering code: Hash of this module's source code
+code_version = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+
+
+def get_plot_digest(key, name, days, panels, trsl, profile):
+    """Provides the content hash of the figure key (see FigureTemplates) for
+    country/group name with the days and the data of the panels (plot ->
+    arguments of FigureTemplates.set_lines) it contains, rendered with the
+    render profile
+    """
+    content = hashlib.sha256()
+    content.update(
+        repr(
+            (
+                code_version,
+                matplotlib.__version__,
+                FigureTemplates.title_font_size,
+                json.dumps(profile, sort_keys=True),
+                key,
+                name,
+                sorted(trsl.items()),
+            )
+        ).encode()
+    )
+    content.update(pd.DatetimeIndex(days).asi8.tobytes())
+    for plot in panels:
+        if plot[:len(key)] != key:
+            continue
+        spec = panels[plot]
+        content.update(
+            repr((plot, {k: v for k, v in spec.items() if k != "values"}))
+            .encode()
+        )
+        for values in spec["values"]:
+            content.update(np.ascontiguousarray(values, "<f8").tobytes())
+    return content.hexdigest()
+
+
+@tracing.traced
+def save_plots(
+    date, base, name, kind, days, plots, panels, trsl, profile, folder=None
+):
+    """Saves the standard set of figures (see FigureTemplates) for base (a
+    country or group, with full name name) into the plot files of day date
+    (in folder, see basics.get_plot_file_path), rendered with the render
+    profile. panels maps the plots (category,
+    variant) to the arguments of FigureTemplates.set_lines. Only figures
+    that aren't in the plot cache are rendered, for the others the cached
+    file is linked. Returns the number of rendered figures and the bytes
+    written.
+    """
+    keys = [()]
+    for category in plots:
+        keys += [(category,)] + [(category, v) for v in plots[category]]
+    keys = [key for key in keys if get_tier(key) in profile["tiers"]]
+
+    # Linking the cached figures
+    file_format = profile["format"]
+    missing = {}
+    for key in keys:
+        digest = get_plot_digest(key, name, days, panels, trsl, profile)
+        cache_file_path = get_plot_cache_file_path(digest, file_format)
+        file_path = get_plot_file_path(
+            date,
+            base,
+            *key,
+            file_format=file_format,
+            profile=profile["name"],
+            folder=folder,
+        )
+        if not cache_file_path.exists():
+            missing[key] = cache_file_path
+        else:
+            tracing.count("figures cached")
+            if not (
+                file_path.exists() and file_path.samefile(cache_file_path)
+            ):
+                link_file(cache_file_path, file_path)
+    if not missing:
+        return 0, 0
+
+    # Rendering (and caching) the others
+    figures = get_templates(kind, days, plots, trsl, profile)
+    with tracing.span("set_lines"):
+        figures.set_titles(name)
+        for plot, spec in panels.items():
+            figures.set_lines(plot, **spec)
+    written = 0
+    for key, cache_file_path in missing.items():
+        file_path = figures.save(date, base, key, folder)
+        written += file_path.stat().st_size
+        link_file(file_path, cache_file_path)
+    tracing.count("plot bytes written", written)
+
+    return len(missing), written
+
+
+@tracing.traced
+def plot_country(date, country, name, data, trsl, profile, folder=None):
+    """Creates the standard set of plots (see show_countries) for country
+    (with full name name) from data (DataFrame with columns (category,
+    variant)) with the render profile, in folder (see save_plots).
+    Returns the number of rendered figures and the bytes written.
+    """
+    plots = {
+        "confirmed": ["cum", "diff"],
+        "deaths": ["cum", "diff"],
+        "active": ["cum", "diff"],
+    }
+    panels = {}
+    for category in plots:
+        panels[category, "cum"] = {
+            "values": [data[category, "cum"].to_numpy()],
+            "styles": ["bo"],
+        }
+
+        # Due to data corrections there are sometimes negative diffs for
+        # confirmed cases, which should be always non-negative. This can lead
+        # to distorted plots and is therefore adjusted by setting the
+        # minimum value of the y-axis to -25.
+        panels[category, "diff"] = {
+            "values": [
+                data[category, "diff"].to_numpy(),
+                data[category, "diff_ma1w"].to_numpy(),
+            ],
+            "styles": ["bo", "r-"],
+            "labels": [None, trsl["diff_ma1w"]],
+            "legend_kw": {"fontsize": "xx-large"},
+            "bottom": -25 if category == "confirmed" else None,
+        }
+
+    rendered, written = save_plots(
+        date,
+        country,
+        name,
+        "countries",
+        data.index,
+        plots,
+        panels,
+        trsl,
+        profile,
+        folder,
+    )
+
+    print_log(f"Plots for {country} finished ({rendered} rendered)")
+
+    return rendered, written
+
+
+@tracing.traced
+def show_countries(
+    date, *countries, length=1000, jobs=1, profile="default", folder=None
+):
     """Creates a standard set of plots for every country provided by the
     argument countries (usually a list). The set contains:
     - Confirmed cases, cumulative and diffs (including the 1-week-moving
@@ -105,9 +531,15 @@ def show_countries(date, *countries, length=1000):
     - Active cases, cumulative and diffs (including the 1-week-moving
       average)
     The plots are available in single-plot files, files per category
-    (containing 2 plots), and a file containing all 6 plots
+    (containing 2 plots), and a file containing all 6 plots; the render
+    profile (see get_render_profiles) determines which of them are produced,
+    their size, resolution, and format. With jobs > 1 the countries are
+    plotted in parallel by a pool of worker processes. The plot files are
+    placed in the folder of day date, or in folder (see
+    basics.get_plot_file_path).
     """
     print_log(f"Plotting countries: {str.join(', ', countries)} ...")
+    start = perf_counter()
 
     # Defining the plots that should be included
     plots = {
@@ -115,127 +547,99 @@ def show_countries(date, *countries, length=1000):
         "deaths": ["cum", "diff", "diff_ma1w"],
         "active": ["cum", "diff", "diff_ma1w"],
     }
-    categories = plots
 
-    # Getting the title text bits
+    # Getting the title text bits and the render profile
     trsl = get_title_translation()
+    render_profile = get_render_profile(profile)
     iso3_to_name = get_base_data(date, columns=("iso3", "name"))
 
     # Read data from files produced by prepare_data
-    data = get_country_data_to_show(date, plots, *countries, length=length)
-    if not data:
+    data = load_series(date, plots, countries, length=length)
+    if data is None:
         return
 
-    # Creating the plots for the selected countries
-    title_font_size = 30
-    for country in countries:
-        # Creating the figure which includes all plots
-        fig_all, axs_all = plt.subplots(3, 2, figsize=(40, 50))
-        fig_all.suptitle(
-            iso3_to_name[country], fontsize=title_font_size, fontweight="bold"
-        )
-
-        for i, category in enumerate(categories):
-            # Creating the figure for all plots per category
-            fig_cat, axs_cat = plt.subplots(2, 1, figsize=(20, 25))
-            fig_cat.suptitle(
-                f"{iso3_to_name[country]} - {trsl[category]}",
-                fontsize=title_font_size,
-                fontweight="bold",
+    # Creating the plots for the selected countries: Every task only gets
+    # the data of its country
+    results = render(
+        plot_country,
+        [
+            (
+                date,
+                country,
+                iso3_to_name[country],
+                data.xs(country, axis="columns", level="country"),
+                trsl,
+                render_profile,
+                folder,
             )
+            for country in dict.fromkeys(countries)
+        ],
+        jobs=jobs,
+    )
 
-            for j, variant in enumerate(["cum", "diff"]):
-                series = data[country][category][variant]
-                days = list(series.index)
-
-                # Creating the figure for single plot (category and variant)
-                fig, axs = plt.subplots(figsize=(25, 16))
-                fig.suptitle(
-                    f"{iso3_to_name[country]} - "
-                    f"{trsl[category]} - {trsl[variant]}",
-                    fontsize=title_font_size,
-                    fontweight="bold",
-                )
-                for ax in [axs, axs_cat[j], axs_all[i][j]]:
-                    ax.set_title(
-                        f"{trsl[category]} - {trsl[variant]}", fontsize=20
-                    )
-                    setup_ax(ax, days)
-                    ax.plot(
-                        list(range(len(series.index))), series.values, "bo"
-                    )
-                    if variant == "diff":
-                        series_ma = data[country][category]["diff_ma1w"]
-                        ax.plot(
-                            list(range(len(series_ma.index))),
-                            series_ma.values,
-                            "r-",
-                            label=trsl["diff_ma1w"],
-                        )
-                        ax.legend(fontsize="xx-large")
-
-                    # Due to data corrections there are sometimes negative
-                    # diffs for confirmed cases, which should be always
-                    # non-negative. This can lead to distorted plots and is
-                    # therefore adjusted by setting the minimum value of the
-                    # y-axis to -25.
-                    if category == "confirmed" and variant == "diff":
-                        ax.set_ylim(bottom=-25)
-
-                # Saving the figure for single plot
-                fig.align_labels()
-                fig.savefig(
-                    get_plot_file_path(date, country, category, variant)
-                )
+    log_render_stats(profile, results, start)
+    print_log("Plotting finished")
 
-            # Saving the figure with all plots per category
-            fig_cat.align_labels()
-            fig_cat.savefig(get_plot_file_path(date, country, category))
 
-        # Saving the figure with all plots
-        fig_all.align_labels()
-        fig_all.savefig(get_plot_file_path(date, country))
+@tracing.traced
+def plot_group(
+    date, group, countries, plots, data, trsl, profile, folder=None
+):
+    """Creates the standard set of plots (see show_groups) for group (with
+    the member countries) from data (DataFrame with columns (category,
+    variant, country)) for the categories and variants in plots, with the
+    render profile, in folder (see save_plots). Returns the number of
+    rendered figures and the bytes written.
+    """
+    print_log(
+        f"Plotting group {group} with countries "
+        f"{str.join(', ', countries)} ..."
+    )
 
-        plt.close("all")
+    # One line per country, colored along the default color cycle
+    styles = [f"C{k % 10}o" for k in range(len(countries))]
+    panels = {}
+    for category in plots:
+        for variant in plots[category]:
+            # Due to data corrections there are sometimes negative diffs for
+            # confirmed cases, which should be always non-negative. This can
+            # lead to distorted plots and is therefore adjusted by setting
+            # the minimum value of the y-axis to -10.
+            values = data[category, variant][countries].to_numpy()
+            panels[category, variant] = {
+                "values": list(values.T),
+                "styles": styles,
+                "labels": countries,
+                "bottom": (
+                    -10
+                    if category == "confirmed"
+                    and variant == "diff_rel_popmio_ma1w"
+                    else None
+                ),
+            }
+
+    rendered, written = save_plots(
+        date,
+        group,
+        group,
+        "groups",
+        data.index,
+        plots,
+        panels,
+        trsl,
+        profile,
+        folder,
+    )
 
-        print_log(f"Plots for {country} finished")
+    print_log(f"Plotting finished ({rendered} rendered)")
 
-    print_log("Plotting finished")
+    return rendered, written
 
 
-def get_group_data_to_show(date, plots, groups, length=1000):
-    """Returns the data from day date for the categories and variants defined
-    in the dictionary plots and the groups in list groups, loaded into a
-    dictionary
-    """
-    file_path = get_data_file_path(date, file_format="json.gz")
-    if not file_path.exists():
-        print("Data not available, please download first.")
-        return False
-        
-    tbl = pd.read_json(
-        file_path,
-        orient="table",
-        compression="gzip",
-    ).sort_index()
-
-    data = dict()
-    for group in groups:
-        data[group] = {category: {} for category in plots}
-    for category, variant, group in [
-        (category, variant, group)
-        for category in plots
-        for variant in plots[category]
-        for group in groups
-    ]:
-        data[group][category][variant] = tbl.loc[
-            (category, variant), groups[group]
-        ].tail(length)
-
-    return data
-
-
-def show_groups(date, groups, length=1000):
+@tracing.traced
+def show_groups(
+    date, groups, length=1000, jobs=1, profile="default", folder=None
+):
     """Creates a standard set of plots for groups of countries provided by the
     argument groups (a dictionary). The set contains:
     - Confirmed cases per million, cumulative and diffs (including the
@@ -245,8 +649,15 @@ def show_groups(date, groups, length=1000):
     - Active cases per million, cumulative and diffs (including the
       1-week-moving average)
     The plots are available in single-plot files, files per category
-    (containing 2 plots), and a file containing all 6 plots
+    (containing 2 plots), and a file containing all 6 plots; the render
+    profile (see get_render_profiles) determines which of them are produced,
+    their size, resolution, and format. With jobs > 1 the groups are
+    plotted in parallel by a pool of worker processes. The plot files are
+    placed in the folder of day date, or in folder (see
+    basics.get_plot_file_path).
     """
+    start = perf_counter()
+
     # Defining the plots that should be included
     plots = {
         "confirmed": ["cum_rel_popmio", "diff_rel_popmio_ma1w"],
@@ -254,135 +665,354 @@ def show_groups(date, groups, length=1000):
         "active": ["cum_rel_popmio", "diff_rel_popmio_ma1w"],
     }
     trsl = get_title_translation()
-    categories = plots
+    render_profile = get_render_profile(profile)
 
     # Reading data from files produced by prepare_data
-    data = get_group_data_to_show(date, plots, groups, length)
-    if not data:
+    members = [country for group in groups.values() for country in group]
+    data = load_series(date, plots, members, length=length)
+    if data is None:
         return
 
-    title_font_size = 30
-    for group, countries in groups.items():
+    # Creating the plots for the groups: Every task only gets the data of
+    # the group's countries
+    country_level = data.columns.get_level_values("country")
+    results = render(
+        plot_group,
+        [
+            (
+                date,
+                group,
+                countries,
+                plots,
+                data.loc[:, country_level.isin(countries)],
+                trsl,
+                render_profile,
+                folder,
+            )
+            for group, countries in groups.items()
+        ],
+        jobs=jobs,
+    )
+
+    log_render_stats(profile, results, start)
+
+
+@tracing.traced
+def show_vintages(
+    date,
+    vintages,
+    *countries,
+    category="confirmed",
+    variant="diff_ma1w",
+    length=365,
+    profile="default",
+):
+    """Creates a plot per country which compares the data vintages: The
+    series of the category and variant as prepared on the days vintages
+    (and on day date), one line per vintage, which shows how the data have
+    been revised upstream (see storing.load_vintages). The revisions between
+    consecutive vintages are logged (without countries there's nothing to
+    compare). The plots are saved as COUNTRY_category_variant_vintages files
+    of day date, with the figure size, resolution, and format of the single
+    plots of the render profile.
+    """
+    vintages = sorted(set(vintages) | {date})
+    if not countries:
+        print_log("No countries specified: Vintages not compared")
+        return
+    print_log(f"Comparing vintages: {str.join(', ', vintages)} ...")
+    data = load_vintages(vintages, category, variant, countries, length)
+    if data is None:
+        return
+
+    for (country, vintage), stats in get_revisions(data).iterrows():
         print_log(
-            f"Plotting group {group} with countries "
-            f"{str.join(', ', countries)} ..."
+            f"{country} {vintage}: {stats['days']:.0f} days revised "
+            f"(max. {stats['max']:,.1f})"
         )
 
-        # Creating the figure which includes all plots
-        fig_all, axs_all = plt.subplots(3, 2, figsize=(40, 50))
-        fig_all.suptitle(group, fontsize=title_font_size, fontweight="bold")
-        for i, category in enumerate(categories):
-            variants = plots[category]
-
-            # Creating the figure for all plots per category
-            fig_cat, axs_cat = plt.subplots(2, 1, figsize=(20, 25))
-            fig_cat.suptitle(
-                f"{group} - {trsl[category]}",
-                fontsize=title_font_size,
-                fontweight="bold",
+    trsl = get_title_translation(variant)
+    render_profile = get_render_profile(profile)
+    iso3_to_name = get_base_data(date, columns=("iso3", "name"))
+    scale = render_profile["font_scale"]
+    file_format = render_profile["format"]
+    for country in dict.fromkeys(countries):
+        fig, ax = plt.subplots(
+            figsize=render_profile["figure_sizes"]["single"]
+        )
+        setup_ax(ax, data.index, scale=scale)
+        for vintage in vintages:
+            ax.plot(
+                np.arange(len(data.index)),
+                data[country, vintage].to_numpy(),
+                "-",
+                linewidth=2 * scale,
+                label=vintage,
             )
-            for j, variant in enumerate(variants):
-                # Creating the figure for single plot (category and variant)
-                fig, axs = plt.subplots(figsize=(25, 16))
-                fig.suptitle(
-                    f"{group} - {trsl[category]} - {trsl[variant]}",
-                    fontsize=title_font_size,
-                    fontweight="bold",
-                )
-                for ax in [axs, axs_cat[j], axs_all[i][j]]:
-                    ax.set_title(
-                        f"{trsl[category]} - {trsl[variant]}", fontsize=20
-                    )
-                    days = list(data[group][category][variant].index)
-                    setup_ax(ax, days)
-                    ax.plot(
-                        list(range(len(days))),
-                        data[group][category][variant][countries],
-                        "o",
-                    )
-                    ax.legend(countries)
-
-                    # Due to data corrections there are sometimes negative
-                    # diffs for confirmed cases, which should be always
-                    # non-negative. This can lead to distorted plots and is
-                    # therefore adjusted by setting the minimum value of the
-                    # y-axis to -10.
-                    if (
-                        category == "confirmed"
-                        and variant == "diff_rel_popmio_ma1w"
-                    ):
-                        ax.set_ylim(bottom=-10)
-
-                # Saving the figure with single plot
-                fig.align_labels()
-                fig.savefig(
-                    get_plot_file_path(date, group, category, variant)
-                )
+        ax.legend(fontsize=14 * scale)
+        ax.set_title(
+            f"{iso3_to_name.get(country, country)} - {trsl[category]} - "
+            f"{trsl[variant]}: Vintages",
+            fontsize=20 * scale,
+        )
+        fig.savefig(
+            get_plot_file_path(
+                date,
+                country,
+                category,
+                variant,
+                "vintages",
+                file_format=file_format,
+                profile=render_profile["name"],
+            ),
+            format=file_format,
+            dpi=render_profile["dpi"],
+        )
+        plt.close(fig)
 
-                # Saving the figure with all plots per category
-            fig_cat.align_labels()
-            fig_cat.savefig(get_plot_file_path(date, group, category))
+    print_log("Comparing vintages finished")
 
-        # Saving the figure with all plots
-        fig_all.align_labels()
-        fig_all.savefig(get_plot_file_path(date, group))
-        plt.close("all")
 
-        print_log("Plotting finished")
+def normalize_rows(values):
+    """Scales the series (rows) of values to the range 0 to 1 (minimum to
+    maximum of each series), series without a range are set to 0
+    """
+    with np.errstate(all="ignore"):
+        low = np.nanmin(values, axis=1, keepdims=True)
+        spread = np.nanmax(values, axis=1, keepdims=True) - low
+        normalized = (values - low) / spread
+    return np.where(
+        spread > 0, normalized, np.where(np.isnan(values), np.nan, 0)
+    )
 
 
-def show_countries_beyond_threshold(
-    date, category, variant, threshold, *countries
+def draw_heatmap(ax, days, countries, values, scale=1):
+    """Draws the series (rows of values, normalized per country) as one
+    image: A row per country, a column per day
+    """
+    image = ax.imshow(
+        normalize_rows(values),
+        aspect="auto",
+        interpolation="nearest",
+        cmap="viridis",
+        vmin=0,
+        vmax=1,
+    )
+    setup_ax(ax, days, scale=scale)
+    ax.set_xlim(-0.5, len(days) - 0.5)
+    ax.grid(False, which="both")
+    ax.set_yticks(np.arange(len(countries)))
+    ax.set_yticklabels(countries)
+    ax.yaxis.set_tick_params(labelsize=min(12, 900 / len(countries)) * scale)
+    return image
+
+
+def get_grid_shape(count):
+    """Provides the shape (rows, columns) of a grid with count panels, the
+    grid roughly square
+    """
+    columns = max(int(np.ceil(np.sqrt(count))), 1)
+    return int(np.ceil(count / columns)), columns
+
+
+def draw_small_multiples(ax, countries, values, scale=1):
+    """Draws the series (rows of values, normalized per country) as a grid
+    of small panels in one axes: All lines are one LineCollection, all
+    panel frames another one
+    """
+    rows, columns = get_grid_shape(len(countries))
+    grid_rows, grid_columns = np.divmod(np.arange(len(countries)), columns)
+    x = np.linspace(0.05, 0.95, values.shape[1])
+    y = 0.1 + 0.7 * normalize_rows(values)
+    segments = np.stack(
+        [
+            grid_columns[:, np.newaxis] + x,
+            rows - 1 - grid_rows[:, np.newaxis] + y,
+        ],
+        axis=-1,
+    )
+    ax.add_collection(LineCollection(segments, linewidths=1.5 * scale))
+
+    # Panel frames and labels
+    corners = np.array([[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]])
+    frames = (
+        np.stack([grid_columns, rows - 1 - grid_rows], axis=-1)[:, None]
+        + corners
+    )
+    ax.add_collection(
+        LineCollection(frames, colors="lightgray", linewidths=0.5 * scale)
+    )
+    for country, column, row in zip(countries, grid_columns, grid_rows):
+        ax.text(
+            column + 0.05,
+            rows - 1 - row + 0.95,
+            country,
+            fontsize=10 * scale,
+            verticalalignment="top",
+        )
+    ax.set_xlim(0, columns)
+    ax.set_ylim(0, rows)
+    ax.set_axis_off()
+
+
+@tracing.traced
+def show_overview(
+    date,
+    category="confirmed",
+    variant="diff_ma1w",
+    countries=None,
+    length=365,
+    kinds=("heatmap", "grid"),
+    profile="default",
 ):
-    """Creates a plot for the variable category -> variant for the group of
-    countries. Here the plots are "normalized": The series starts with the
-    day the variable first exceeds the threshold. I.e., the x-axis just
-    shows the number of days (past exceeding the threshold), not calendar
-    days.
+    """Creates the overview of the countries (default: all single countries,
+    i.e. without the region aggregates, the US states, and the total, see
+    basics.is_country) for category and variant over the last length days,
+    each as one figure of kinds:
+    - heatmap: One row per country, the colors show the values normalized
+      per country (minimum to maximum over the days)
+    - grid: Small multiples, one panel per country with its normalized
+      series
+    The series aren't drawn one by one but as one image or one collection of
+    lines, so an overview of all countries takes only seconds. The figures
+    are saved into the files overview_category_variant_kind of day date
+    (with the figure size of all plots, the resolution, and the format of
+    the render profile).
     """
-    # Fetching the relevant data and loading it into a DataFrame
-    plots = {category: [variant]}
-    data = get_country_data_to_show(date, plots, *countries)
-    if not data:
+    if not cube_exists(date):
+        print("Data not available, please download first.")
         return
 
-    tbl = pd.DataFrame()
-    for country in countries:
-        tbl.insert(
-            loc=len(tbl.columns),
-            column=country,
-            value=data[country][category][variant],
+    print_log(f"Plotting overview ({category} - {variant}) ...")
+    store = get_store(date)
+
+    # By default one row (panel) per single country: The US states would
+    # show the USA twice
+    if countries is None:
+        countries = [
+            country for country in store.countries if is_country(country)
+        ]
+    start = max(len(store.dates) - length, 0)
+    values = store.get_values(category, variant, tuple(countries), start).T
+    days = store.dates[start:]
+
+    trsl = get_title_translation(variant)
+    render_profile = get_render_profile(profile)
+    scale = render_profile["font_scale"]
+    file_format = render_profile["format"]
+    for kind in kinds:
+        fig, ax = plt.subplots(figsize=render_profile["figure_sizes"]["all"])
+        if kind == "heatmap":
+            draw_heatmap(ax, days, countries, values, scale=scale)
+        else:
+            draw_small_multiples(ax, countries, values, scale=scale)
+        ax.set_title(
+            f"{trsl[category]} - {trsl[variant]}: {len(countries)} "
+            f"countries, {days[0].date()} - {days[-1].date()} (normalized)",
+            fontsize=30 * scale,
         )
+        fig.tight_layout()
+        fig.savefig(
+            get_plot_file_path(
+                date,
+                "overview",
+                category,
+                variant,
+                kind,
+                file_format=file_format,
+                profile=render_profile["name"],
+            ),
+            format=file_format,
+            dpi=render_profile["dpi"],
+        )
+        plt.close(fig)
+
+    print_log("Plotting overview finished")
+
+
+@tracing.traced
+def show_countries_beyond_threshold(
+    date,
+    category,
+    variant,
+    threshold,
+    *countries,
+    profile="default",
+    show=False,
+):
+    """Creates a plot for the variable category -> variant for the group of
+    countries (default: all single countries, i.e. without the region
+    aggregates, the US states, and the total, see basics.is_country). Here
+    the plots are "normalized": The series starts with the day the variable
+    first exceeds the threshold (see storing.align_beyond_threshold). I.e.,
+    the x-axis just shows the number of days (past exceeding the threshold),
+    not calendar days. Countries which never exceed the threshold aren't
+    included. The plot is saved into the file
+    beyond_threshold_category_variant_threshold of day date (with the figure
+    size of the single plots, the resolution, and the format of the render
+    profile), and shown if show=True.
+    """
+    if not cube_exists(date):
+        print("Data not available, please download first.")
+        return
 
-    # Initializing the plot
-    fig, ax = plt.subplots(figsize=(20, 7.5))
-
-    # Processing the series into the plot
-    for country in tbl.columns:
-        series = tbl[country]
-        series.index = np.arange(len(series.index))
-        try:
-            # Adjust the series: New series starts with the first day it
-            # exceeds the threshold
-            start = series[series > threshold].index[0]
-            series_new = pd.Series(series[start:].values)
-            series_new.name = series.name
-            # Adding new series to plot
-            ax.plot(series_new, ".")
-        finally:
-            # If all values of the series are below the threshold the series
-            # isn't included in the plot (obviously)
-            pass
-
-    # Setting up the plot
+    # Fetching the relevant data (in the order of the countries) and
+    # aligning all series at once. By default the single countries: The US
+    # states would count the USA twice, the aggregates and TTL even more
+    # often.
+    store = get_store(date)
+    countries = list(dict.fromkeys(countries)) or [
+        country for country in store.countries if is_country(country)
+    ]
+    aligned, starts = align_beyond_threshold(
+        store.get_values(category, variant, tuple(countries)), threshold
+    )
+    crossed = starts >= 0
+    print_log(
+        f"{crossed.sum()} of {len(countries)} countries beyond threshold "
+        f"{threshold:g} ({category} - {variant})"
+    )
+    if not crossed.any():
+        return
+    aligned = aligned[: len(store.dates) - starts[crossed].min(), crossed]
+    countries = [
+        country for country, beyond in zip(countries, crossed) if beyond
+    ]
+
+    # Plotting all series with one call
+    render_profile = get_render_profile(profile)
+    scale = render_profile["font_scale"]
+    fig, ax = plt.subplots(figsize=render_profile["figure_sizes"]["single"])
+    ax.plot(np.arange(len(aligned)), aligned, ".", markersize=4 * scale)
+
+    # Setting up the plot: A legend only for a manageable number of
+    # countries
     ax.grid(which="major", linestyle="dashed", linewidth=1)
-    trsl = get_title_translation()
+    trsl = get_title_translation(variant)
     ax.set_title(
         f"{trsl[category]} - {trsl[variant]}: "
-        f"Days beyond threshold ({threshold})"
+        f"Days beyond threshold ({threshold:g})",
+        fontsize=20 * scale,
+    )
+    ax.set_xlabel("days", fontsize=14 * scale)
+    ax.set_ylabel(f"{category}", fontsize=14 * scale)
+    if len(countries) <= 20:
+        ax.legend(countries, fontsize=14 * scale)
+
+    file_format = render_profile["format"]
+    fig.savefig(
+        get_plot_file_path(
+            date,
+            "beyond_threshold",
+            category,
+            variant,
+            f"{threshold:g}",
+            file_format=file_format,
+            profile=render_profile["name"],
+        ),
+        format=file_format,
+        dpi=render_profile["dpi"],
     )
-    ax.set_xlabel(f"days")
-    ax.set_ylabel(f"{category}")
-    ax.legend(countries)
-    plt.show()
-    plt.close("all")
+    if show:
+        plt.show()
+    plt.close(fig)
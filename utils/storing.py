@@ -0,0 +1,697 @@
+from collections import OrderedDict
+import re
+
+import numpy as np
+import pandas as pd
+
+from utils import tracing
+from utils.archiving import (
+    get_archived_dates,
+    has_data,
+    is_archived,
+    materialize_date,
+)
+from utils.basics import *
+
+
+# Storing the prepared data: One dense binary array ("cube") with the axes
+# (category, variant, date, country), plus a small JSON-header which indexes
+# the axes and holds the population sizes. The cube is accessed via
+# memory-mapping, so reading a few series only touches the parts of the file
+# that contain them.
+# In compact mode the cumulated counts are stored as 32-bit integers (with a
+# sentinel for missing values), and the data stores keep the variants in
+# the data types of their downcasting rules (see DataStore.compact_dtypes).
+
+# Sentinel for missing values (NaN) in integer cubes
+missing_value = np.iinfo("int32").min
+
+
+def get_cube_file_paths(date):
+    """Provides the paths to the cube file and its header file of day date"""
+    return (
+        get_data_file_path(date, file_format="bin"),
+        get_data_file_path(date, name="data_header", file_format="json"),
+    )
+
+
+def get_cube_dtype(cube, compact=False):
+    """Provides the data type in which the cumulated data (cube) is stored:
+    64-bit floats, or, if compact, 32-bit integers (if all values are
+    integers within their range, otherwise the cube isn't compacted)
+    """
+    if not compact:
+        return "<f8"
+
+    # Checking category by category (no temporaries of the cube's size),
+    # missing values (NaN) are ignored
+    limits = np.iinfo("int32")
+    if all(
+        np.nanmin(values, initial=0) > limits.min
+        and np.nanmax(values, initial=0) <= limits.max
+        and not np.any(np.remainder(values, 1) > 0)
+        for values in cube
+    ):
+        return "<i4"
+    print_log("Cube not compacted: Values aren't 32-bit integers")
+    return "<f8"
+
+
+def to_integers(values):
+    """Converts values (floats) into 32-bit integers: Missing values (NaN)
+    become the sentinel missing_value
+    """
+    return np.where(np.isnan(values), missing_value, values).astype("<i4")
+
+
+def to_floats(values):
+    """Converts values of a cube into floats: Missing values in integer
+    cubes (see missing_value) become NaN
+    """
+    if values.dtype.kind == "f":
+        return np.array(values, dtype="<f8")
+    floats = values.astype("<f8")
+    floats[values == missing_value] = np.nan
+    return floats
+
+
+def from_compact(values):
+    """Provides the values of a variant kept in its compact data type (see
+    DataStore.to_compact) for the callers: Integers as floats (see
+    to_floats), floats as they are
+    """
+    if values.dtype.kind == "i":
+        return to_floats(values)
+    return values
+
+
+@tracing.traced
+def write_cube(
+    date,
+    categories,
+    days,
+    countries,
+    cube,
+    population,
+    compact=False,
+    feed_hashes=None,
+):
+    """Writes the cumulated data (array cube with the axes (category, day,
+    country)) and the population sizes of the countries (dictionary country
+    -> population) into the cube file of day date. With compact=True the
+    cube is stored as 32-bit integers (see get_cube_dtype), and the data
+    stores of the cube work in compact mode (see DataStore). The hashes of
+    the feed files and of the region aggregates the data are prepared from
+    (feed_hashes, see prepping.get_feed_hashes) are recorded in the header.
+    The header is written last, i.e. the cube is only available if it has
+    been written completely.
+    """
+    # Removing the old files first: They might be hard links to the files of
+    # another day (see prepping.reuse_prepared_data)
+    cube_file_path, header_file_path = get_cube_file_paths(date)
+    header_file_path.unlink(missing_ok=True)
+    cube_file_path.unlink(missing_ok=True)
+
+    # The array is written category by category: Its memory layout already
+    # is the one of the cube file (only one variant), and a compacted cube
+    # is converted one category at a time (no copy of the whole cube)
+    dtype = get_cube_dtype(cube, compact)
+    with cube_file_path.open("wb") as file:
+        for values in cube:
+            if dtype == "<i4":
+                values = to_integers(values)
+            values = np.ascontiguousarray(values, dtype=dtype)
+            values.tofile(file)
+            tracing.count("cube bytes written", values.nbytes)
+
+    header = {
+        "dtype": dtype,
+        "compact": compact,
+        "sha256": feed_hashes,
+        "shape": (len(categories), 1, len(days), len(countries)),
+        "categories": list(categories),
+        "variants": ["cum"],
+        "dates": [day.strftime("%Y-%m-%d") for day in days],
+        "countries": list(countries),
+        "population": [population.get(country) for country in countries],
+    }
+    with header_file_path.open("w") as file:
+        json.dump(header, file, indent=4)
+
+
+def cube_exists(date):
+    """Checks if the (completely written) cube of day date is available,
+    either in its data directory or, if the directory has no data (see
+    archiving.materialize_date), archived. Nothing is restored or created:
+    The archived data are restored when the cube is opened (see
+    load_cube_header, open_cube, and get_store).
+    """
+    dir_path = get_dir_path("base_data") / date
+    if has_data(dir_path):
+        return (dir_path / "data_header.json").exists()
+    return is_archived(date, prepared=True)
+
+
+def get_prepared_dates():
+    """Provides the (sorted) days for which prepared data are available,
+    including the archived ones (see archiving)
+    """
+    return sorted(
+        {
+            path.name
+            for path in get_dir_path("base_data").iterdir()
+            if path.is_dir() and get_cube_file_paths(path.name)[1].exists()
+        }
+        | set(get_archived_dates(prepared=True))
+    )
+
+
+def load_cube_header(date):
+    """Loads the header of the cube of day date (archived data are restored
+    first, see archiving.materialize_date)
+    """
+    materialize_date(date)
+    with get_cube_file_paths(date)[1].open("r") as file:
+        return json.load(file)
+
+
+@tracing.traced
+def open_cube(date):
+    """Opens the cube of day date: Returns the header and the read-only
+    memory-mapped array (its values in the stored data type, see to_floats).
+    Archived data are restored first (see load_cube_header).
+    """
+    header = load_cube_header(date)
+    cube_file_path = get_cube_file_paths(date)[0]
+    cube = np.memmap(
+        cube_file_path,
+        dtype=header["dtype"],
+        mode="r",
+        shape=tuple(header["shape"]),
+    )
+    return header, cube
+
+
+# Deriving data variants: Vectorized operations along the day axis (second
+# to last axis) of arrays with any number of leading axes, i.e. they work on
+# a single table (day, country) as well as on the whole cube (category, day,
+# country)
+
+
+def get_diffs(values):
+    """Provides the 1-day differences (the first day is NaN)"""
+    diffs = np.full_like(values, np.nan)
+    diffs[..., 1:, :] = values[..., 1:, :] - values[..., :-1, :]
+    return diffs
+
+
+def get_prefix_sums(values):
+    """Provides the prefix sums of values (NaNs count as 0) and the prefix
+    counts of their NaNs along the day axis, both with a leading day of
+    zeros: The sums over any window are the differences of two of them
+    """
+    nans = np.isnan(values)
+    padding = np.zeros(values.shape[:-2] + (1, values.shape[-1]))
+    sums = np.cumsum(
+        np.concatenate([padding, np.where(nans, 0.0, values)], axis=-2),
+        axis=-2,
+    )
+    counts = np.cumsum(np.concatenate([padding, nans], axis=-2), axis=-2)
+    return sums, counts
+
+
+def get_window_sums(values, window=7, prefix_sums=None):
+    """Provides the moving sums over window days, computed via the prefix
+    sums (see get_prefix_sums, which can be passed in as prefix_sums), i.e.
+    in one pass, independent of the window size. As with pandas'
+    rolling(window).sum() the sum is NaN if the window isn't complete or
+    contains NaNs.
+    """
+    sums, counts = prefix_sums or get_prefix_sums(values)
+    window_sums = np.full_like(values, np.nan)
+    window_sums[..., window - 1:, :] = np.where(
+        counts[..., window:, :] > counts[..., :-window, :],
+        np.nan,
+        sums[..., window:, :] - sums[..., :-window, :],
+    )
+    return window_sums
+
+
+def get_moving_averages(values, window=7, prefix_sums=None):
+    """Provides the moving averages over window days (see get_window_sums)"""
+    return get_window_sums(values, window, prefix_sums) / window
+
+
+def get_growth_ratios(values, window=7, prefix_sums=None):
+    """Provides the ratios of the sums over the last window days and the
+    sums over the window days before (e.g. week over week), NaN if one of
+    the windows isn't complete (see get_window_sums) or the sum before is 0
+    """
+    window_sums = get_window_sums(values, window, prefix_sums)
+    ratios = np.full_like(values, np.nan)
+    before = window_sums[..., :-window, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios[..., window:, :] = np.where(
+            before == 0, np.nan, window_sums[..., window:, :] / before
+        )
+    return ratios
+
+
+def get_exponential_averages(values, spans):
+    """Provides the exponential moving averages for all spans (days) at
+    once, with the smoothing factor 2 / (span + 1), as pandas'
+    ewm(span, adjust=False, ignore_na=True).mean(): The averages start with
+    the first value, NaNs keep the average of the day before. The recursion
+    runs once over the days, vectorized over the spans, the leading axes,
+    and the countries. Returns the list of the arrays (one per span).
+    """
+    alphas = 2 / (np.array(spans, dtype="float64") + 1)
+    alphas = alphas.reshape((-1,) + (1,) * (values.ndim - 1))
+    averages = np.empty((len(spans),) + values.shape)
+    current = np.full((len(spans),) + values[..., 0, :].shape, np.nan)
+    for day in range(values.shape[-2]):
+        day_values = values[..., day, :]
+        current = np.where(
+            np.isnan(current),
+            day_values,
+            np.where(
+                np.isnan(day_values),
+                current,
+                current + alphas * (day_values - current),
+            ),
+        )
+        averages[..., day, :] = current
+    return list(averages)
+
+
+def get_window_statistics(values, statistics):
+    """The engine of the windowed statistics: Computes the statistics
+    (pairs (statistic, days)) of values along the day axis, each for all
+    leading axes and countries at once:
+    - ma, sum: Moving average and moving sum over days
+    - wow: Ratio of the sums over days and over the days before
+    - ema: Exponential moving average with a span of days
+    The moving sums, averages, and ratios share one computation of the
+    prefix sums and are O(n) independent of the windows, the exponential
+    moving averages share one recursion over the days. Returns a
+    dictionary (statistic, days) -> array.
+    """
+    statistics = list(dict.fromkeys(statistics))
+    results = {}
+    if any(statistic != "ema" for statistic, _ in statistics):
+        prefix_sums = get_prefix_sums(values)
+    functions = {
+        "ma": get_moving_averages,
+        "sum": get_window_sums,
+        "wow": get_growth_ratios,
+    }
+    for statistic, days in statistics:
+        if statistic != "ema":
+            results[statistic, days] = functions[statistic](
+                values, days, prefix_sums
+            )
+    spans = [days for statistic, days in statistics if statistic == "ema"]
+    if spans:
+        for days, averages in zip(
+            spans, get_exponential_averages(values, spans)
+        ):
+            results["ema", days] = averages
+    return results
+
+
+def align_beyond_threshold(values, threshold):
+    """Aligns the series (columns) of values (days x countries) at the days
+    they first exceed the threshold: Row k of the result holds the values k
+    days after the crossing of every country (NaN beyond the end of the
+    series). The crossing days of all countries are found at once (argmax
+    along the days). Returns the aligned array and the crossing days (-1 for
+    the countries which never exceed the threshold, their columns are NaN).
+    """
+    beyond = values > threshold
+    starts = np.where(beyond.any(axis=0), beyond.argmax(axis=0), -1)
+    days = np.arange(values.shape[0])[:, np.newaxis] + starts
+    inside = (starts >= 0) & (days < values.shape[0])
+    aligned = np.where(
+        inside,
+        np.take_along_axis(
+            values, np.clip(days, 0, values.shape[0] - 1), axis=0
+        ),
+        np.nan,
+    )
+    return aligned, starts
+
+
+def parse_window_variant(variant):
+    """Parses the windowed variant (see basics.get_variants) into its base
+    variant, statistic, and window days, e.g. diff_rel_popmio_ma2w ->
+    (diff_rel_popmio, ma, 14), or diff_wow -> (diff, wow, 7). Any window of
+    weeks (w) or days (d) is accepted, e.g. diff_ema10d. Returns None for
+    other variants.
+    """
+    base, _, name = variant.rpartition("_")
+    if not (base == "diff" or base.startswith("diff_rel_pop")):
+        return None
+    if name == "wow":
+        return base, "wow", 7
+    match = re.fullmatch(r"(ma|sum|ema)([1-9][0-9]*[wd])", name)
+    if match is None:
+        return None
+    return base, match[1], get_window_days(match[2])
+
+
+# Providing the data: Only the cumulated data are stored, all other
+# variants are derived from them on first access
+
+
+class DataStore:
+    """Provides the data of day date: The cumulated data are read from the
+    cube, the other variants (see basics.get_variants) are derived from
+    them when they are requested for the first time. Requests can be
+    restricted to some countries and the days from a start day on: Then
+    only those parts of the cube are read (plus the days before start that
+    are needed to derive the variants). The results are kept in a memo cache
+    which holds at most cache_size arrays (the least recently used are
+    dropped first).
+    Stores of compact cubes keep the arrays in the data types of their
+    variants (see compact_dtypes), which are derived from the
+    full-precision values: The intermediate variants (e.g. diff for
+    diff_ma1w) aren't taken from the memo cache then, but computed again.
+    Variants kept as 32-bit integers are returned as 64-bit floats.
+    The windowed statistics (see get_window_statistics) of a base variant
+    are derived together: A request for one of them also puts the others of
+    basics.get_variants that share its computation into the memo cache.
+    """
+
+    # Population scales of the relative variants
+    scales = {"popmio": 1e6, "pop100k": 1e5}
+
+    # Downcasting rules of compact stores: The data types of the variants
+    # by their kind (see get_compact_dtype).
+    # - The cumulated counts are kept exactly as 32-bit integers, with a
+    #   sentinel for missing values (see to_integers), if the cube holds
+    #   32-bit integers (otherwise as 32-bit floats).
+    # - The other variants are kept as 32-bit floats: They hold the daily
+    #   counts exactly up to 2**24, and the relative and windowed variants
+    #   with a relative error below 6e-8.
+    # The NaNs (missing data, heads of the diffs and moving averages) are
+    # kept.
+    compact_dtypes = {
+        "cum": "int32",
+        "cum_rel": "float32",
+        "diff": "float32",
+        "diff_rel": "float32",
+        "diff_rel_active": "float32",
+        "sum": "float32",
+        "ma": "float32",
+        "wow": "float32",
+        "ema": "float32",
+    }
+
+    def __init__(self, date, cache_size=64):
+        self.date = date
+        self.header, self.cube = open_cube(date)
+        self.dates = pd.DatetimeIndex(self.header["dates"])
+        self.countries = self.header["countries"]
+        self.country_index = {
+            country: k for k, country in enumerate(self.countries)
+        }
+        self.population = np.array(
+            self.header["population"], dtype="float64"
+        )
+        self.compact = self.header.get("compact", False)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def get(self, category, variant):
+        """Returns the table (dates x countries) of the category and
+        variant
+        """
+        return pd.DataFrame(
+            self.get_values(category, variant),
+            index=self.dates,
+            columns=self.countries,
+        )
+
+    def select(self, plots, countries, length=None):
+        """Returns the data for the categories and variants defined in the
+        dictionary plots, the countries, and the last length days: One
+        DataFrame with the dates as index and the (sorted) columns
+        (category, variant, country)
+        """
+        countries = tuple(countries)
+        start = 0 if length is None else max(len(self.dates) - length, 0)
+        keys = [
+            (category, variant)
+            for category in plots
+            for variant in plots[category]
+        ]
+        return pd.DataFrame(
+            np.concatenate(
+                [self.get_values(*key, countries, start) for key in keys],
+                axis=1,
+            ),
+            index=self.dates[start:],
+            columns=pd.MultiIndex.from_tuples(
+                [key + (country,) for key in keys for country in countries],
+                names=["category", "variant", "country"],
+            ),
+        ).sort_index(axis="columns")
+
+    def get_values(self, category, variant, countries=None, start=0):
+        """Returns the array (dates x countries) of the category and variant,
+        restricted to the countries (a tuple, default: all countries) and the
+        days from the start-th on. Besides the variants of get_variants any
+        windowed statistic of the diffs is available (see
+        parse_window_variant), e.g. diff_ma3w or diff_rel_popmio_ema10d.
+        """
+        key = category, variant, countries, start
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return from_compact(self.cache[key])
+
+        if (
+            variant not in get_variants(category)
+            and parse_window_variant(variant) is None
+        ):
+            raise KeyError(f"Unknown variant {variant} of {category}")
+        with tracing.span("derive", category=category, variant=variant):
+            derived = self.derive(category, variant, countries, start)
+        if not isinstance(derived, dict):
+            derived = {variant: derived}
+
+        # The variants derived together are all kept, the requested one as
+        # the most recently used
+        for name, values in derived.items():
+            if self.compact:
+                values = self.to_compact(name, values)
+            self.cache[category, name, countries, start] = values
+            tracing.count("variants derived")
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        return from_compact(self.cache[key])
+
+    def get_compact_dtype(self, variant):
+        """Provides the data type of variant in compact stores (see
+        compact_dtypes): The rule of the windowed statistic (see
+        parse_window_variant), of the variant itself, or of its base
+        (e.g. cum_rel for cum_rel_popmio). Integer types are only used for
+        cubes of integers.
+        """
+        window = parse_window_variant(variant)
+        if window is not None:
+            dtype = self.compact_dtypes[window[1]]
+        elif variant in self.compact_dtypes:
+            dtype = self.compact_dtypes[variant]
+        else:
+            dtype = self.compact_dtypes[variant[:variant.index("_rel") + 4]]
+        if np.dtype(dtype).kind == "i" and self.cube.dtype.kind != "i":
+            return "float32"
+        return dtype
+
+    def to_compact(self, variant, values):
+        """Converts the values of variant into its compact data type (see
+        get_compact_dtype)
+        """
+        dtype = self.get_compact_dtype(variant)
+        if np.dtype(dtype).kind == "i":
+            return to_integers(values)
+        return values.astype(dtype)
+
+    def get_base(self, category, variant, countries, start):
+        """Provides the array of category and variant (see get_values) for
+        the derivation of another variant: From the memo cache, or, in
+        compact stores, in full precision (see derive)
+        """
+        if self.compact:
+            values = self.derive(category, variant, countries, start)
+            return values[variant] if isinstance(values, dict) else values
+        return self.get_values(category, variant, countries, start)
+
+    def derive(self, category, variant, countries, start):
+        """Reads (cum) or derives the array of category and variant (see
+        get_values for countries and start):
+        - cum_rel_<scale>: cum / (population / scale)
+        - diff(_rel_<scale>): 1-day differences of cum(_rel_<scale>)
+        - <base>_<statistic><window>: Windowed statistic of <base> (see
+          derive_windowed)
+        - diff_rel_active: diff relative to cum of the day before
+        Variants that depend on earlier days are derived from the lookback
+        days before start on, which are cut off afterwards.
+        """
+        columns = slice(None)
+        if countries is not None:
+            columns = [self.country_index[country] for country in countries]
+
+        if variant == "cum":
+            i = self.header["categories"].index(category)
+            return to_floats(self.cube[i, 0, start:][:, columns])
+        if parse_window_variant(variant) is not None:
+            return self.derive_windowed(category, variant, countries, start)
+        if variant == "diff_rel_active":
+            first = max(start - 1, 0)
+            cum = self.get_base(category, "cum", countries, first)
+            diff = self.get_base(category, "diff", countries, first)
+            rel = np.full_like(cum, np.nan)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                rel[1:] = diff[1:] / cum[:-1]
+            return rel[start - first:]
+        if variant.startswith("diff"):
+            first = max(start - 1, 0)
+            base = "cum" + variant[4:]
+            return get_diffs(
+                self.get_base(category, base, countries, first)
+            )[start - first:]
+        scale = self.scales[variant[8:]]
+        return self.get_base(category, "cum", countries, start) / (
+            self.population[columns] / scale
+        )
+
+    def derive_windowed(self, category, variant, countries, start):
+        """Derives the windowed statistic variant (see parse_window_variant)
+        together with the windowed variants of get_variants which have the
+        same base and share its computation (see get_window_statistics): The
+        moving sums, averages, and ratios, or the exponential moving
+        averages. The moving statistics need the window days before start
+        (two windows for the ratios), the exponential moving averages are
+        always computed from the first day on. Returns a dictionary variant
+        -> array.
+        """
+        base, statistic, days = parse_window_variant(variant)
+        kinds = ("ema",) if statistic == "ema" else ("ma", "sum", "wow")
+        family = {variant: (statistic, days)}
+        for sibling in get_variants(category):
+            parsed = parse_window_variant(sibling)
+            if parsed is not None and parsed[0] == base and parsed[1] in kinds:
+                family[sibling] = parsed[1:]
+
+        if statistic == "ema":
+            first = 0
+        else:
+            lookback = max(
+                days * (2 if statistic == "wow" else 1)
+                for statistic, days in family.values()
+            )
+            first = max(start - lookback + 1, 0)
+        results = get_window_statistics(
+            self.get_base(category, base, countries, first),
+            family.values(),
+        )
+        return {
+            name: results[statistics][start - first:]
+            for name, statistics in family.items()
+        }
+
+
+# Process-wide cache of the data stores: date -> (file state, store)
+stores = {}
+
+
+def get_cube_state(date):
+    """Provides the state (modification time, inode) of the cube header of
+    day date: It changes whenever the cube is prepared again
+    """
+    stat = get_cube_file_paths(date)[1].stat()
+    return stat.st_mtime_ns, stat.st_ino
+
+
+def get_store(date):
+    """Provides the DataStore of day date from the process-wide cache. The
+    cache is keyed by the date and the state of the cube (see
+    get_cube_state), i.e. a newly prepared cube replaces the cached store.
+    Archived data are restored first (see archiving.materialize_date).
+    """
+    materialize_date(date)
+    file_state = get_cube_state(date)
+    if date not in stores or stores[date][0] != file_state:
+        stores[date] = file_state, DataStore(date)
+    return stores[date][1]
+
+
+@tracing.traced
+def load_series(date, plots, countries, length=None):
+    """Query function for the data of day date: Loads the series for the
+    categories and variants defined in the dictionary plots (category ->
+    list of variants), the countries (duplicates are dropped), and the last
+    length days. Returns a DataFrame with the dates as index and the
+    columns (category, variant, country), or None if there aren't any
+    prepared data for date.
+    """
+    if not cube_exists(date):
+        print("Data not available, please download first.")
+        return None
+
+    return get_store(date).select(plots, dict.fromkeys(countries), length)
+
+
+@tracing.traced
+def load_vintages(vintages, category, variant, countries, length=None):
+    """Query function for the revisions of the data: Loads the series of the
+    category and variant for the countries from the data prepared on the
+    days vintages (data vintages), each only for the countries (see
+    load_series). Returns a DataFrame with all days as index (the last
+    length days) and the columns (country, vintage), or None if there
+    aren't any prepared data for one of the vintages. Countries a vintage
+    doesn't contain (e.g. the region aggregates or the US states in older
+    vintages) are logged, their series are missing (NaN) there.
+    """
+    countries = list(dict.fromkeys(countries))
+    tables = {}
+    for vintage in dict.fromkeys(vintages):
+        if not cube_exists(vintage):
+            print("Data not available, please download first.")
+            return None
+        store = get_store(vintage)
+        present = [c for c in countries if c in store.country_index]
+        missing = [c for c in countries if c not in store.country_index]
+        if missing:
+            print_log(f"Not in vintage {vintage}: {str.join(', ', missing)}")
+        table = pd.DataFrame(index=store.dates)
+        if present:
+            table = store.select({category: [variant]}, present)
+            table = table[category, variant]
+        tables[vintage] = table.reindex(columns=countries)
+
+    data = pd.concat(tables, axis="columns", names=["vintage", "country"])
+    data = data.swaplevel(axis="columns").sort_index(axis="columns")
+    return data if length is None else data.iloc[-length:]
+
+
+def get_revisions(data):
+    """Provides the revisions between the consecutive vintages of the
+    DataFrame data (see load_vintages): For every country and vintage (but
+    the first) the number of days whose values differ from the preceding
+    vintage, and the largest absolute difference
+    """
+    revisions = {}
+    for country in data.columns.unique("country"):
+        table = data[country]
+        for previous, vintage in zip(table.columns, table.columns[1:]):
+            changes = (table[vintage] - table[previous]).abs()
+            changes = changes[changes > 0]
+            revisions[country, vintage] = {
+                "days": len(changes),
+                "max": changes.max() if len(changes) else 0.0,
+            }
+    return pd.DataFrame.from_dict(revisions, orient="index")
@@ -0,0 +1,216 @@
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+import json
+import os
+import threading
+from time import perf_counter_ns, time_ns
+
+
+# Tracing: Nested timing spans (e.g. prepare_data -> read_feeds) and counters
+# (e.g. rows parsed, bytes written) of the stages of the application. The
+# trace is kept in memory and written on request into a JSON summary and a
+# Chrome-trace file (chrome://tracing, Perfetto). Tracing is disabled by
+# default: Then the spans are a shared no-op context and the counters return
+# immediately.
+
+
+class Tracer:
+    """Records the spans (Chrome-trace events) and counters of a process.
+    The nesting of the spans is kept per thread.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def get_stack(self):
+        """Provides the stack of the open spans of the current thread"""
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextmanager
+    def span(self, name, args):
+        """Records the time spent inside the with-block as span name, with
+        the arguments args (dictionary) attached
+        """
+        stack = self.get_stack()
+        stack.append(name)
+        path = str.join("/", stack)
+        wall_start, start = time_ns(), perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration = perf_counter_ns() - start
+            stack.pop()
+            self.events.append(
+                {
+                    "name": name,
+                    "cat": "span",
+                    "ph": "X",
+                    "ts": wall_start / 1000,
+                    "dur": duration / 1000,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": {"path": path, **args},
+                }
+            )
+
+    def count(self, name, value):
+        """Adds value to the counter name"""
+        with self.lock:
+            self.counters[name] += value
+
+    def mark(self, message):
+        """Records the (log) message as instant event"""
+        self.events.append(
+            {
+                "name": message,
+                "cat": "log",
+                "ph": "i",
+                "s": "t",
+                "ts": time_ns() / 1000,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+            }
+        )
+
+    def collect(self):
+        """Returns the events and counters recorded so far and resets them"""
+        with self.lock:
+            collected = self.events, dict(self.counters)
+            self.events, self.counters = [], defaultdict(int)
+        return collected
+
+    def merge(self, collected):
+        """Adds the collected events and counters (see collect) of another
+        tracer, e.g. of a worker process
+        """
+        events, counters = collected
+        self.events.extend(events)
+        for name, value in counters.items():
+            self.count(name, value)
+
+    def get_summary(self):
+        """Provides the summary of the trace: For every span path (e.g.
+        prepare_data/read_feeds) the number of calls, and the total and
+        maximal duration (in seconds), and the counters
+        """
+        spans = {}
+        for event in self.events:
+            if event["ph"] != "X":
+                continue
+            stats = spans.setdefault(
+                event["args"]["path"], {"calls": 0, "total": 0.0, "max": 0.0}
+            )
+            duration = event["dur"] / 1e6
+            stats["calls"] += 1
+            stats["total"] += duration
+            stats["max"] = max(stats["max"], duration)
+        return {"spans": spans, "counters": dict(self.counters)}
+
+    def get_chrome_trace(self):
+        """Provides the trace in the Chrome-trace format, the times relative
+        to the first event
+        """
+        events = sorted(self.events, key=lambda event: event["ts"])
+        origin = events[0]["ts"] if events else 0
+        return {
+            "traceEvents": [
+                {**event, "ts": event["ts"] - origin} for event in events
+            ],
+            "displayTimeUnit": "ms",
+            "otherData": {"counters": dict(self.counters)},
+        }
+
+
+# Tracer of the current process: None if tracing is disabled
+tracer = None
+
+# Span while tracing is disabled: Does nothing
+no_span = nullcontext()
+
+
+def enable_tracing(reset=False):
+    """Enables tracing in the current process, with reset=True a new trace is
+    started (e.g. in a forked worker process, which otherwise would take over
+    the events of its parent)
+    """
+    global tracer
+    if tracer is None or reset:
+        tracer = Tracer()
+    return tracer
+
+
+def is_tracing():
+    """Checks if tracing is enabled"""
+    return tracer is not None
+
+
+def span(name, **args):
+    """Context manager which records the time spent inside the with-block as
+    span name (with the keyword arguments attached), if tracing is enabled
+    """
+    if tracer is None:
+        return no_span
+    return tracer.span(name, args)
+
+
+def traced(function):
+    """Decorator which records the calls of function as spans named after
+    the function, if tracing is enabled
+    """
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if tracer is None:
+            return function(*args, **kwargs)
+        with tracer.span(function.__name__, {}):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+def count(name, value=1):
+    """Adds value to the counter name, if tracing is enabled"""
+    if tracer is not None:
+        tracer.count(name, value)
+
+
+def mark(message):
+    """Records the (log) message, if tracing is enabled"""
+    if tracer is not None:
+        tracer.mark(message)
+
+
+def call_traced(function, args):
+    """Calls function with the arguments args in a worker process and
+    returns its result together with the events and counters recorded
+    meanwhile, which are merged into the trace of the parent process (see
+    merge_traced)
+    """
+    result = function(*args)
+    return result, enable_tracing().collect()
+
+
+def merge_traced(outcome):
+    """Merges the events and counters of the outcome of call_traced and
+    returns the actual result
+    """
+    result, collected = outcome
+    enable_tracing().merge(collected)
+    return result
+
+
+def write_trace(summary_file_path, trace_file_path):
+    """Writes the summary (see Tracer.get_summary) and the Chrome-trace of
+    the trace into the files summary_file_path and trace_file_path
+    """
+    if tracer is None:
+        return
+    with summary_file_path.open("w") as file:
+        json.dump(tracer.get_summary(), file, indent=4)
+    with trace_file_path.open("w") as file:
+        json.dump(tracer.get_chrome_trace(), file)